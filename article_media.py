@@ -0,0 +1,135 @@
+import bisect
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+
+import metrics
+from config_load import CONFIG
+from media_policy import media_policy
+from push_article_to_cms import upload
+
+logger = logging.getLogger(__name__)
+
+# HTMLResourceExtractor 的资源类型 -> upload() 的资源类型；
+# 未列出的类型（样式表、脚本等 other_resource）和视频平台的 iframe 嵌入不上传，正文中保留原地址
+UPLOAD_TYPES = {
+    'image': 'image',
+    'video': 'media',
+    'media': 'media',
+    'audio': 'audio',
+    'file': 'file',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    """所有文章共用的媒体上传线程池，限制全局并发上传数"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=CONFIG.get('MEDIA_UPLOAD_WORKERS', 8),
+                                           thread_name_prefix='media-upload')
+        return _executor
+
+
+def rewrite_urls(content, located, unlocated=None):
+    """
+    一次遍历正文完成所有地址替换
+    :param content: 原始 HTML
+    :param located: [(start, end, new_url)]，按抽取时记录的位置替换属性值
+    :param unlocated: {old_url: new_url}，没有位置信息的地址，替换其在正文中的所有出现
+    :return: 替换后的 HTML
+    """
+    spans = []
+    position = 0
+    for start, end, new_url in sorted(located):
+        if start < position:
+            # 与前一处替换重叠
+            continue
+        spans.append((start, end, escape(new_url)))
+        position = end
+
+    if unlocated:
+        # 多模式匹配，长的地址优先，避免被其前缀截断；finditer 的匹配之间互不重叠
+        pattern = re.compile('|'.join(re.escape(url) for url in sorted(unlocated, key=len, reverse=True)))
+        starts = [span[0] for span in spans]
+        matches = []
+        for m in pattern.finditer(content):
+            # 与有位置信息的替换重叠时以位置信息为准
+            i = bisect.bisect_right(starts, m.start())
+            if (i > 0 and spans[i - 1][1] > m.start()) or (i < len(spans) and spans[i][0] < m.end()):
+                continue
+            matches.append((m.start(), m.end(), escape(unlocated[m.group(0)])))
+        spans = sorted(spans + matches)
+
+    if not spans:
+        return content
+
+    parts = []
+    position = 0
+    for start, end, new_url in spans:
+        parts.append(content[position:start])
+        parts.append(new_url)
+        position = end
+    parts.append(content[position:])
+    return ''.join(parts)
+
+
+def upload_article_media(content, resources):
+    """
+    并发上传一篇文章中的所有资源，并一次性替换正文中的地址
+    :param content: 文章 HTML
+    :param resources: HTMLResourceExtractor 提取的资源字典
+    :return: (替换后的 HTML, 上传成功的 CMS 地址列表，按资源在字典中的顺序)
+    """
+    records = []
+    for extracted_type, items in resources.items():
+        resource_type = UPLOAD_TYPES.get(extracted_type)
+        for item in items or []:
+            if resource_type is None or item.get('type') == 'iframe-video':
+                metrics.MEDIA.inc(outcome='skipped_type')
+                continue
+            # 统计像素、过小的图片等不下载，正文中保留原地址
+            reason = media_policy.check_resource(resource_type, item)
+            if reason:
+                metrics.MEDIA.inc(outcome='skipped_policy')
+                logger.debug("Media skipped", extra={'url': item.get('url'), 'reason': reason})
+                continue
+            records.append((resource_type, item))
+    if not records:
+        return content, []
+
+    # 同一地址只上传一次
+    executor = _get_executor()
+    futures = {}
+    for resource_type, item in records:
+        key = (item.get('url'), resource_type)
+        if key not in futures:
+            futures[key] = executor.submit(upload, item.get('url'), resource_type)
+
+    uploaded = {}
+    for key, future in futures.items():
+        try:
+            uploaded[key] = future.result()
+        except Exception as e:
+            logger.warning("文件上传失败", extra={'url': key[0], 'error': str(e)})
+            uploaded[key] = False
+
+    images = []
+    located = []
+    unlocated = {}
+    for resource_type, item in records:
+        upload_url = uploaded[(item.get('url'), resource_type)]
+        if not upload_url:
+            continue
+        images.append(upload_url)
+        if item.get('start') is not None:
+            located.append((item['start'], item['end'], upload_url))
+        else:
+            unlocated[item.get('url')] = upload_url
+
+    return rewrite_urls(content, located, unlocated), images
@@ -0,0 +1,324 @@
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from local_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# 发件箱中的一篇文章
+# meta: 条目的 {'id', 'link', 'title'}，发布完成后用于更新已发布索引
+OutboxItem = namedtuple('OutboxItem', ['id', 'article', 'meta', 'attempts'])
+
+PENDING = 'pending'
+POSTING = 'posting'
+POSTED = 'posted'
+FAILED = 'failed'
+
+
+class ArticleOutbox(SQLiteStore):
+    """持久化的文章发件箱：采集流程只负责写入，后台的 OutboxDrainer 负责发布
+
+    每篇文章的状态为 pending -> posting -> posted，多次失败后为 failed，可以用 replay 重新发布。
+    """
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS outbox (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               entry_key TEXT UNIQUE,
+               title TEXT,
+               payload TEXT NOT NULL,
+               meta TEXT,
+               status TEXT NOT NULL,
+               attempts INTEGER NOT NULL DEFAULT 0,
+               next_attempt REAL NOT NULL,
+               last_error TEXT,
+               created_at REAL NOT NULL,
+               updated_at REAL NOT NULL
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)',
+    )
+
+    def enqueue(self, article, meta=None, entry_key=None):
+        """
+        写入一篇待发布的文章，同一 entry_key 只写入一次
+        :return: 是否新写入
+        """
+        now = time.time()
+        return self.execute(
+            '''INSERT OR IGNORE INTO outbox (entry_key, title, payload, meta, status, next_attempt, created_at, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            (entry_key, article.get('title'), json.dumps(article, ensure_ascii=False),
+             json.dumps(meta or {}, ensure_ascii=False), PENDING, now, now, now)
+        ) == 1
+
+    def status_of(self, entry_key):
+        """
+        :return: 该 entry_key 的 (id, 状态)，没有记录时为 None
+        """
+        rows = self.query('SELECT id, status FROM outbox WHERE entry_key = ?', (entry_key,))
+        return rows[0] if rows else None
+
+    def claim_due(self, limit, now=None):
+        """
+        取出最多 limit 篇到期的文章并标记为 posting，多个进程共用发件箱时不会取到同一篇
+        :return: [OutboxItem]
+        """
+        now = now or time.time()
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            rows = self._conn.execute(
+                '''SELECT id, payload, meta, attempts FROM outbox
+                   WHERE status = ? AND next_attempt <= ? ORDER BY next_attempt LIMIT ?''',
+                (PENDING, now, limit)
+            ).fetchall()
+            self._conn.executemany('UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?',
+                                   [(POSTING, now, row[0]) for row in rows])
+        return [OutboxItem(row[0], json.loads(row[1]), json.loads(row[2] or '{}'), row[3]) for row in rows]
+
+    def mark_posted(self, item_id):
+        self.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL, updated_at = ? '
+                     'WHERE id = ?', (POSTED, time.time(), item_id))
+
+    def mark_retry(self, item_id, error, next_attempt):
+        self.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, next_attempt = ?, '
+                     'updated_at = ? WHERE id = ?', (PENDING, error, next_attempt, time.time(), item_id))
+
+    def mark_failed(self, item_id, error):
+        self.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, updated_at = ? '
+                     'WHERE id = ?', (FAILED, error, time.time(), item_id))
+
+    def recover(self, stale_after=0):
+        """
+        把进程中断时仍为 posting 的文章放回 pending。
+        这些文章可能已经发布，重新发布前由 OutboxDrainer 的 already_posted 检查。
+        :param stale_after: 只恢复超过该时间（秒）没有更新的记录，多个进程共用发件箱时应大于一次发布的最长时间
+        :return: 恢复的数量
+        """
+        now = time.time()
+        return self.execute('UPDATE outbox SET status = ?, attempts = attempts + 1, next_attempt = ?, updated_at = ? '
+                            'WHERE status = ? AND updated_at <= ?', (PENDING, now, now, POSTING, now - stale_after))
+
+    def replay(self, ids=None, status=FAILED):
+        """
+        把失败的文章重新放回待发布队列
+        :param ids: 指定的记录 id，None 表示该状态的全部记录
+        :return: 放回的数量
+        """
+        now = time.time()
+        if ids:
+            placeholders = ','.join('?' * len(ids))
+            return self.execute(f'UPDATE outbox SET status = ?, attempts = 0, next_attempt = ?, updated_at = ? '
+                                f'WHERE status = ? AND id IN ({placeholders})', (PENDING, now, now, status, *ids))
+        return self.execute('UPDATE outbox SET status = ?, attempts = 0, next_attempt = ?, updated_at = ? '
+                            'WHERE status = ?', (PENDING, now, now, status))
+
+    def counts(self):
+        """
+        :return: {状态: 数量}
+        """
+        return dict(self.query('SELECT status, COUNT(*) FROM outbox GROUP BY status'))
+
+    def items(self, status=None, limit=100):
+        """
+        :return: [(id, 标题, 状态, 尝试次数, 最近错误, 更新时间)]
+        """
+        if status:
+            return self.query('SELECT id, title, status, attempts, last_error, updated_at FROM outbox '
+                              'WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit))
+        return self.query('SELECT id, title, status, attempts, last_error, updated_at FROM outbox '
+                          'ORDER BY id DESC LIMIT ?', (limit,))
+
+    def next_due(self):
+        rows = self.query('SELECT MIN(next_attempt) FROM outbox WHERE status = ?', (PENDING,))
+        return rows[0][0] if rows else None
+
+
+class OutboxDrainer:
+    """后台发布发件箱中的文章：并发数有上限，失败按指数退避重试，超过次数后标记为 failed"""
+
+    def __init__(self, outbox, post, workers=4, max_attempts=8, backoff=30, backoff_max=3600,
+                 poll_interval=1.0, recover_after=0, already_posted=None, on_result=None):
+        """
+        Args:
+            outbox (ArticleOutbox): 发件箱
+            post (callable): post(article) -> bool，发布一篇文章
+            workers (int): 同时发布的文章数上限
+            max_attempts (int): 最多尝试次数，之后标记为 failed
+            backoff (float): 第一次重试前的等待时间（秒），之后每次加倍
+            backoff_max (float): 重试等待时间上限（秒）
+            poll_interval (float): 没有新文章通知时检查发件箱的间隔（秒）
+            recover_after (float): 启动时恢复超过该时间（秒）仍为 posting 的文章，见 ArticleOutbox.recover
+            already_posted (callable): already_posted(article) -> bool，重试前检查上次尝试是否其实已经成功
+            on_result (callable): on_result(item, posted)，文章发布成功或最终失败时调用
+        """
+        self.outbox = outbox
+        self.post = post
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.recover_after = recover_after
+        self.already_posted = already_posted
+        self.on_result = on_result
+
+        self._wakeup = threading.Condition()
+        self._inflight = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def notify(self):
+        """有新文章写入时调用，立即唤醒发布线程"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _deliver(self, item):
+        try:
+            if item.attempts and self.already_posted is not None and self.already_posted(item.article):
+                # 上次尝试超时或进程中断，但 CMS 已经收到
+                posted, error = True, None
+            else:
+                posted, error = bool(self.post(item.article)), None
+        except Exception as e:
+            posted, error = False, str(e)
+
+        try:
+            self._record(item, posted, error or 'CMS rejected the article')
+        except Exception:
+            logger.exception("Failed to update outbox", extra={'outbox_id': item.id})
+        finally:
+            with self._wakeup:
+                self._inflight -= 1
+                self._wakeup.notify_all()
+
+    def _record(self, item, posted, error):
+        if posted:
+            self.outbox.mark_posted(item.id)
+            metrics.OUTBOX.inc(outcome='posted')
+            self._notify_result(item, True)
+            return
+
+        attempts = item.attempts + 1
+        if attempts >= self.max_attempts:
+            self.outbox.mark_failed(item.id, error)
+            metrics.OUTBOX.inc(outcome='failed')
+            logger.error("Article failed permanently", extra={'outbox_id': item.id, 'title': item.article.get('title'),
+                                                              'attempts': attempts, 'error': error})
+            self._notify_result(item, False)
+            return
+
+        delay = min(self.backoff * 2 ** (attempts - 1), self.backoff_max)
+        delay *= random.uniform(0.8, 1.2)
+        self.outbox.mark_retry(item.id, error, time.time() + delay)
+        metrics.OUTBOX.inc(outcome='retry')
+        logger.warning("Article post will be retried", extra={'outbox_id': item.id, 'attempts': attempts,
+                                                              'retry_in_s': round(delay, 1), 'error': error})
+
+    def _notify_result(self, item, posted):
+        if self.on_result is not None:
+            try:
+                self.on_result(item, posted)
+            except Exception:
+                logger.exception("Outbox result callback failed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            with self._wakeup:
+                free = self.workers - self._inflight
+            items = []
+            if free > 0:
+                try:
+                    items = self.outbox.claim_due(free)
+                except Exception as e:
+                    logger.error("Failed to read outbox", extra={'error': str(e)})
+
+            with self._wakeup:
+                self._inflight += len(items)
+            for item in items:
+                self._executor.submit(self._deliver, item)
+
+            with self._wakeup:
+                if not items or self._inflight >= self.workers:
+                    self._wakeup.wait(self.poll_interval)
+
+    def start(self):
+        """
+        启动后台发布线程，先恢复上次中断时仍在发布中的文章
+        """
+        if self._thread is not None:
+            return self
+        with self._wakeup:
+            if self._thread is None:
+                recovered = self.outbox.recover(self.recover_after)
+                if recovered:
+                    logger.warning("Recovered interrupted outbox items", extra={'count': recovered})
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox')
+                self._thread = threading.Thread(target=self._run, name='outbox-drainer', daemon=True)
+                self._thread.start()
+        return self
+
+    def flush(self, timeout=None):
+        """
+        等待当前到期的文章都发布完（或进入退避等待），返回是否在超时前完成
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        self.notify()
+        while True:
+            with self._wakeup:
+                idle = self._inflight == 0
+            next_due = self.outbox.next_due()
+            if idle and (next_due is None or next_due > time.time()):
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            with self._wakeup:
+                self._wakeup.wait(0.05)
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self.notify()
+        if self._thread is not None and wait:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and replay the article outbox')
+    parser.add_argument('--db', help='outbox database, defaults to OUTBOX_DB in config.yaml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='count articles by status')
+    list_parser = subparsers.add_parser('list', help='list recent articles')
+    list_parser.add_argument('--status', choices=(PENDING, POSTING, POSTED, FAILED))
+    list_parser.add_argument('--limit', type=int, default=50)
+    replay_parser = subparsers.add_parser('replay', help='queue failed articles for posting again')
+    replay_parser.add_argument('ids', nargs='*', type=int, help='outbox ids, all failed articles when omitted')
+    args = parser.parse_args()
+
+    if args.db:
+        path = args.db
+    else:
+        from config_load import CONFIG
+        path = CONFIG['OUTBOX_DB']
+    outbox = ArticleOutbox(path)
+
+    if args.command == 'status':
+        for status, count in sorted(outbox.counts().items()):
+            print(f'{status:<8} {count}')
+    elif args.command == 'list':
+        for item_id, title, status, attempts, last_error, updated_at in outbox.items(args.status, args.limit):
+            updated = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated_at))
+            print(f'{item_id:>6} {status:<8} {attempts:>2} {updated} {title} {last_error or ""}')
+    elif args.command == 'replay':
+        print(f'{outbox.replay(args.ids)} articles queued for posting')
+
+
+if __name__ == '__main__':
+    main()
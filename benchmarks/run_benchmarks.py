@@ -0,0 +1,402 @@
+"""
+离线基准测试：微基准 + 使用本地桩 CMS 的端到端吞吐量测试。
+
+在仓库根目录运行（config_load 从当前目录读取 config.yaml）：
+
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --only micro
+    python -m benchmarks.run_benchmarks --only import --import-budget-ms 300
+    python -m benchmarks.run_benchmarks --feeds 50 --entries 20 --latency 0.02
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/20240101-120000.json
+
+结果保存在 benchmarks/results/<时间>.json，可以用 --compare 与之前的结果对比。
+导入耗时超出预算、导入时启动了线程或加载了重量级依赖时，退出码为 1，可用于 CI。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import synthetic_feeds
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+E2E_MODES = ('pipeline', 'concurrent', 'sequential')
+
+# 入口模块，导入时不应加载重量级依赖、启动线程或访问网络
+IMPORT_MODULES = ('feed_rss_pull', 'push_article_to_cms', 'cms_token', 'text_summarizer')
+HEAVY_MODULES = ('jieba', 'networkx', 'numpy', 'scipy', 'bs4', 'feedparser')
+
+_IMPORT_PROBE = '''
+import json, sys, threading, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'ms': round(elapsed * 1000, 1),
+    'threads': threading.active_count() - 1,
+    'heavy_modules': [name for name in {heavy!r} if name in sys.modules],
+}}))
+'''
+
+
+def _timeit(func, repeat=5, number=1):
+    """
+    多次运行 func，返回单次耗时的最好值和中位数（毫秒）
+    """
+    func()  # 预热，排除首次加载词典等开销
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) * 1000 / number)
+    return {'best_ms': round(min(timings), 4), 'median_ms': round(statistics.median(timings), 4)}
+
+
+def _english_text(sentences, seed=0):
+    rng = random.Random(seed)
+    return ' '.join(synthetic_feeds._sentence(rng) for _ in range(sentences))
+
+
+def bench_summarizer():
+    from document_frequency import DocumentFrequencyStore
+    from text_summarizer import TextSummarizer
+
+    results = {}
+    texts = {'short': _english_text(60), 'long': _english_text(600)}
+    for engine in ('networkx', 'vectorized'):
+        summarizer = TextSummarizer(language='english', engine=engine, process_workers=0)
+        for size, text in texts.items():
+            if engine == 'networkx' and size == 'long':
+                # 原始实现在长文本上需要数十秒，只测短文本
+                continue
+            repeat = 3 if engine == 'networkx' else 10
+            results[f'summarizer.{engine}.{size}'] = _timeit(lambda: summarizer.generate_summary(text, top_n=3),
+                                                              repeat=repeat)
+
+    summarizer = TextSummarizer(language='english', process_workers=0)
+    results['summarizer.keywords.long'] = _timeit(lambda: summarizer.get_keywords(texts['long']), repeat=10)
+
+    # 按语料库 TF-IDF 打分：先计入 200 篇文章的文档频率
+    with tempfile.TemporaryDirectory() as workdir:
+        store = DocumentFrequencyStore(os.path.join(workdir, 'term_stats.db'))
+        summarizer = TextSummarizer(language='english', process_workers=0, document_frequencies=store)
+        for seed in range(200):
+            summarizer.add_document(_english_text(40, seed=seed + 1))
+        results['summarizer.keywords_tfidf.long'] = _timeit(lambda: summarizer.get_keywords(texts['long']),
+                                                            repeat=10)
+        store.close()
+    return results
+
+
+def bench_long_document(sentences=3000):
+    """
+    长文档摘要：分层计算与完整图的耗时、tracemalloc 峰值内存
+    """
+    import tracemalloc
+
+    from text_summarizer import TextSummarizer
+
+    text = _english_text(sentences, seed=sentences)
+    results = {}
+    for name, long_document_sentences in (('chunked', 400), ('full_graph', 0)):
+        summarizer = TextSummarizer(language='english', process_workers=0,
+                                    long_document_sentences=long_document_sentences)
+        # 完整图在数千句时需要数百 MB 内存，只运行一次
+        result = _timeit(lambda: summarizer.generate_summary(text, top_n=3), repeat=3 if name == 'chunked' else 1)
+        tracemalloc.start()
+        summarizer.generate_summary(text, top_n=3)
+        result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+        results[f'summarizer.long_document.{name}.{sentences}'] = result
+    return results
+
+
+def bench_extractor():
+    from bs4 import BeautifulSoup
+
+    from html_resource_extractor import HTMLResourceExtractor
+
+    html = synthetic_feeds.entry_html(random.Random(0), 'https://cdn.example.com/media/', paragraphs=60, images=20)
+    extractor = HTMLResourceExtractor()
+
+    def two_pass():
+        BeautifulSoup(html, 'html.parser').get_text()
+        extractor.extract_resources(html)
+
+    return {
+        'extractor.beautifulsoup_two_pass': _timeit(two_pass, repeat=10),
+        'extractor.streaming_single_pass': _timeit(lambda: extractor.extract(html), repeat=10),
+    }
+
+
+def bench_url_file_name():
+    from push_article_to_cms import get_url_file_name
+
+    rng = random.Random(0)
+    urls = [f'https://cdn-images-1.medium.com/max/1024/{rng.getrandbits(64):016x}' + rng.choice(['', '.png', '.jpeg'])
+            for _ in range(10000)]
+
+    def run():
+        for url in urls:
+            get_url_file_name(url, 'image')
+
+    result = _timeit(run, repeat=5)
+    result['urls_per_sec'] = round(len(urls) / (result['median_ms'] / 1000))
+    return {'get_url_file_name.10k': result}
+
+
+def bench_image_optimizer():
+    import importlib.util
+    if importlib.util.find_spec('PIL') is None:
+        return {}
+    import io
+
+    from PIL import Image
+
+    from image_optimizer import ImageOptimizer
+
+    # 3000x2000 的高质量 JPEG，接近相机原图的尺寸
+    image = Image.effect_mandelbrot((3000, 2000), (-2, -1.2, 1, 1.2), 100).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=95)
+    content = buffer.getvalue()
+
+    results = {}
+    for output_format in ('webp', 'jpeg'):
+        optimizer = ImageOptimizer(output_format=output_format, workers=0)
+        optimized = optimizer.optimize(content, 'photo.jpg')[0]
+        result = _timeit(lambda: optimizer.optimize(content, 'photo.jpg'), repeat=3)
+        result['original_bytes'] = len(content)
+        result['optimized_bytes'] = len(optimized)
+        results[f'image_optimizer.{output_format}.3000x2000'] = result
+    return results
+
+
+def run_micro():
+    results = {}
+    for bench in (bench_summarizer, bench_long_document, bench_extractor, bench_url_file_name, bench_image_optimizer):
+        print(f'Running {bench.__name__} ...')
+        results.update(bench())
+    return results
+
+
+def _e2e_worker(args):
+    """
+    在独立进程中运行一次端到端测试，所有本地状态写入临时目录，结果写入 args.output
+    """
+    from config_load import CONFIG
+
+    from benchmarks.stub_cms import StubCMS
+
+    workdir = tempfile.mkdtemp(prefix='web3content-bench-')
+    stub = StubCMS(CONFIG, latency=args.latency, media_size=args.media_size).start()
+    stub.feeds = synthetic_feeds.corpus(feeds=args.feeds, entries=args.entries, media_base=stub.media_base())
+
+    # 必须在使用 feed_rss_pull 之前修改配置，模块级对象在首次使用时读取配置
+    CONFIG.update({
+        'CMS_HOST': stub.base_url,
+        'feed_source': stub.feed_urls(),
+        'FEED_INGEST_MODE': 'pipeline' if args.mode == 'pipeline' else 'concurrent',
+        'FEED_FETCH_WORKERS': 1 if args.mode == 'sequential' else CONFIG.get('FEED_FETCH_WORKERS', 8),
+        'FEED_CACHE_DB': os.path.join(workdir, 'feed_cache.db'),
+        'PUBLISHED_INDEX_DB': os.path.join(workdir, 'published_index.db'),
+        'PUBLISHED_INDEX_WARM_ON_START': False,
+        'SUMMARY_CACHE_DB': os.path.join(workdir, 'summary_cache.db'),
+        'MEDIA_CACHE_DB': os.path.join(workdir, 'media_cache.db'),
+        'OUTBOX_DB': os.path.join(workdir, 'outbox.db'),
+        'NEAR_DUP_DB': os.path.join(workdir, 'near_duplicates.db'),
+        'TERM_STATS_DB': os.path.join(workdir, 'term_stats.db'),
+        'FEED_LEASE_DB': os.path.join(workdir, 'feed_leases.db'),
+        'FEED_SCHEDULE_DB': os.path.join(workdir, 'feed_schedule.db'),
+    })
+
+    import feed_rss_pull
+
+    def run_cycle():
+        feed_rss_pull.fetch_and_post_feeds()
+        if feed_rss_pull.outbox() is not None:
+            # 文章写入发件箱后由后台发布，等发布完成再计时结束
+            feed_rss_pull.get_outbox_drainer().flush()
+
+    start = time.perf_counter()
+    run_cycle()
+    cold_seconds = time.perf_counter() - start
+    cold_counts = dict(stub.counts)
+
+    # 第二轮没有新内容，衡量稳态下一个周期的开销
+    start = time.perf_counter()
+    run_cycle()
+    warm_seconds = time.perf_counter() - start
+
+    articles = len(stub.articles)
+    result = {
+        'articles': articles,
+        'expected_articles': args.feeds * args.entries,
+        'cold_seconds': round(cold_seconds, 3),
+        'articles_per_sec': round(articles / cold_seconds, 2) if cold_seconds else 0,
+        'warm_seconds': round(warm_seconds, 3),
+        'uploaded_bytes': stub.uploaded_bytes,
+        'requests': cold_counts,
+    }
+    stub.stop()
+    feed_rss_pull.summarizer().close()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def run_e2e(modes, feeds, entries, latency, media_size):
+    results = {}
+    for mode in modes:
+        print(f'Running end-to-end ({mode}, {feeds} feeds x {entries} entries, latency {latency}s) ...')
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        command = [sys.executable, '-m', 'benchmarks.run_benchmarks', '--e2e-worker', '--mode', mode,
+                   '--feeds', str(feeds), '--entries', str(entries), '--latency', str(latency),
+                   '--media-size', str(media_size), '--output', output]
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f'End-to-end run {mode} failed:\n{completed.stderr[-2000:]}')
+            continue
+        with open(output, encoding='utf-8') as f:
+            results[f'e2e.{mode}'] = json.load(f)
+        os.unlink(output)
+    return results
+
+
+def measure_import(module, repeat=3):
+    """
+    在新的解释器中导入模块，返回最快一次的导入耗时（毫秒）、导入后新增的线程数和已加载的重量级依赖
+    """
+    code = _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['ms'])
+    return {'ms': best['ms'], 'threads': max(run['threads'] for run in runs),
+            'heavy_modules': best['heavy_modules']}
+
+
+def run_import_check(budget_ms):
+    """
+    检查入口模块的导入开销
+    :return: (结果, 不满足要求的说明列表)
+    """
+    results = {}
+    failures = []
+    for module in IMPORT_MODULES:
+        print(f'Measuring import time of {module} ...')
+        result = measure_import(module)
+        results[f'import.{module}'] = {'ms': result['ms'], 'threads': result['threads']}
+        if result['ms'] > budget_ms:
+            failures.append(f"importing {module} took {result['ms']} ms (budget {budget_ms} ms)")
+        if result['threads']:
+            failures.append(f"importing {module} started {result['threads']} thread(s)")
+        if result['heavy_modules']:
+            failures.append(f"importing {module} loaded {', '.join(result['heavy_modules'])}")
+    return results, failures
+
+
+def _flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(previous, current):
+    """
+    打印两次结果中数值指标的变化
+    """
+    old = _flatten(previous.get('results', {}))
+    new = _flatten(current.get('results', {}))
+    print(f"\nCompared with {previous.get('timestamp')} ({previous.get('git_revision')}):")
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        change = f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+        print(f'  {name:<60} {before:>12} -> {after:<12} {change}')
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the feed ingestion job')
+    parser.add_argument('--only', choices=('import', 'micro', 'e2e'), help='run only one group of benchmarks')
+    parser.add_argument('--modes', default=','.join(E2E_MODES), help='end-to-end modes, comma separated')
+    parser.add_argument('--feeds', type=int, default=20, help='number of synthetic feeds')
+    parser.add_argument('--entries', type=int, default=10, help='entries per feed')
+    parser.add_argument('--latency', type=float, default=0.01, help='stub server latency per request (seconds)')
+    parser.add_argument('--media-size', type=int, default=20 * 1024, help='size of each media file (bytes)')
+    parser.add_argument('--import-budget-ms', type=float, default=500,
+                        help='maximum time to import each entry point module (milliseconds)')
+    parser.add_argument('--compare', help='previous result file to compare against')
+    parser.add_argument('--no-save', action='store_true', help='do not write a result file')
+    parser.add_argument('--e2e-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.e2e_worker:
+        _e2e_worker(args)
+        return
+
+    results = {}
+    failures = []
+    if args.only in (None, 'import'):
+        import_results, failures = run_import_check(args.import_budget_ms)
+        results.update(import_results)
+    if args.only in (None, 'micro'):
+        results.update(run_micro())
+    if args.only in (None, 'e2e'):
+        modes = [mode for mode in args.modes.split(',') if mode]
+        results.update(run_e2e(modes, args.feeds, args.entries, args.latency, args.media_size))
+
+    report = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'git_revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'parameters': {'feeds': args.feeds, 'entries': args.entries, 'latency': args.latency,
+                       'media_size': args.media_size, 'import_budget_ms': args.import_budget_ms},
+        'results': results,
+    }
+    print(json.dumps(results, indent=2))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results saved to {path}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+    if failures:
+        print('\nImport check failed:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from gmssl import sm2
+
+# 固定的 SM2 私钥，桩服务器只需要提供对应的公钥，不解密密码
+_PRIVATE_KEY = '00B9AB0B828FF68872F21A837FC303668428DEA11DCD1B24429D0C99E24EED83D5'
+
+
+def _public_key():
+    crypt = sm2.CryptSM2(public_key='', private_key=_PRIVATE_KEY)
+    return crypt._kg(int(_PRIVATE_KEY, 16), sm2.default_ecc_table['g'])
+
+
+class StubCMS:
+    """
+    本地桩服务器，实现 config.yaml 中的 CMS 接口，同时提供合成 feed 和媒体文件，完全离线运行。
+
+    - /feeds/<name>   返回 feeds 中对应的 XML，支持 ETag 条件请求
+    - /media/<name>   返回按名称生成的确定性二进制内容
+    - 其余路径按 config 中的 *_PATH 响应登录、刷新、公钥、标题校验、发布和上传请求
+    """
+
+    def __init__(self, config, feeds=None, latency=0.0, media_size=20 * 1024, host='127.0.0.1', port=0):
+        """
+        Args:
+            config (dict): 读取接口路径的配置，通常为 CONFIG
+            feeds (dict): {feed 名称: XML 字符串}
+            latency (float): 每个请求附加的延迟（秒），模拟网络往返
+            media_size (int): 媒体文件大小（字节）
+        """
+        self.config = config
+        self.feeds = dict(feeds or {})
+        self.latency = latency
+        self.media_size = media_size
+        self.public_key = _public_key()
+
+        self.articles = []
+        self.titles = set()
+        self.counts = {}
+        self.uploaded_bytes = 0
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def feed_urls(self):
+        return [f'{self.base_url}/feeds/{name}' for name in self.feeds]
+
+    def media_base(self):
+        return f'{self.base_url}/media/'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def media_bytes(self, name):
+        """按名称生成确定性的内容，同名文件内容相同，便于验证按内容去重"""
+        rng = random.Random(name)
+        return b'\x89PNG\r\n\x1a\n' + rng.randbytes(max(0, self.media_size - 8))
+
+    def _handler(self):
+        stub = self
+        config = self.config
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b'', content_type='application/json', headers=None):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                elif isinstance(body, str):
+                    body = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def _token(self):
+                return {'result': {'accessToken': 'stub-token', 'refreshToken': 'stub-refresh',
+                                   'expiresIn': config.get('DEFAULT_EXPIRES_IN', 1800)}}
+
+            def do_HEAD(self):
+                if urlparse(self.path).path.startswith('/media/'):
+                    # 媒体探测请求单独计数，不计入下载
+                    stub._count('media_probe')
+                    return self._send(200, stub.media_bytes(urlparse(self.path).path), 'image/png')
+                self.do_GET()
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parsed = urlparse(self.path)
+                path = parsed.path
+
+                if path.startswith('/feeds/'):
+                    stub._count('feed')
+                    xml = stub.feeds.get(path[len('/feeds/'):])
+                    if xml is None:
+                        return self._send(404, {'error': 'no such feed'})
+                    etag = '"' + hashlib.md5(xml.encode()).hexdigest() + '"'
+                    if self.headers.get('If-None-Match') == etag:
+                        return self._send(304, headers={'ETag': etag})
+                    return self._send(200, xml, 'application/rss+xml', {'ETag': etag})
+
+                if path.startswith('/media/'):
+                    body = stub.media_bytes(path)
+                    if self.headers.get('Range') == 'bytes=0-0':
+                        stub._count('media_probe')
+                        return self._send(206, body[:1], 'image/png', {'Content-Range': f'bytes 0-0/{len(body)}'})
+                    stub._count('media_download')
+                    return self._send(200, body, 'image/png')
+
+                if path == config['PUBLIC-KEY_PATH']:
+                    stub._count('public_key')
+                    return self._send(200, stub.public_key, 'text/plain')
+
+                if path == config['CHECK_ARTICLE_TITLE_PATH']:
+                    stub._count('title_exist')
+                    title = parse_qs(parsed.query).get('title', [''])[0]
+                    with stub._lock:
+                        exists = title in stub.titles
+                    return self._send(200, {'data': exists})
+
+                if path == config.get('ARTICLE_LIST_PATH', config['NEW_ARTICLE_PATH']):
+                    stub._count('article_list')
+                    query = parse_qs(parsed.query)
+                    page = int(query.get('pageNum', ['1'])[0])
+                    size = int(query.get('pageSize', ['100'])[0])
+                    with stub._lock:
+                        records = [{'title': a.get('title')} for a in stub.articles[(page - 1) * size:page * size]]
+                    return self._send(200, {'data': {'records': records}})
+
+                self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                path = urlparse(self.path).path
+                body = self._read_body()
+
+                if path == config['LOGIN_PATH']:
+                    stub._count('login')
+                    return self._send(200, self._token())
+
+                if path == config['REFRESH_PATH']:
+                    stub._count('refresh')
+                    return self._send(200, self._token())
+
+                if path == config['NEW_ARTICLE_PATH']:
+                    stub._count('article')
+                    article = json.loads(body or b'{}')
+                    with stub._lock:
+                        stub.articles.append(article)
+                        stub.titles.add(article.get('title'))
+                    return self._send(200, {'code': 200, 'data': len(stub.articles)})
+
+                upload_paths = {config[key] for key in ('IMAGE_UPLOAD_PATH', 'MEDIA_UPLOAD_PATH',
+                                                        'AUDIO_UPLOAD_PATH', 'FILE_UPLOAD_PATH')}
+                if path in upload_paths:
+                    stub._count('upload')
+                    with stub._lock:
+                        stub.uploaded_bytes += len(body)
+                    digest = hashlib.sha1(body).hexdigest()[:16]
+                    return self._send(200, {'url': f'{stub.base_url}/cms-assets/{digest}'})
+
+                self._send(404, {'error': 'not found'})
+
+        return Handler
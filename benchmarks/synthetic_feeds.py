@@ -0,0 +1,141 @@
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+# 生成正文用的词表，混入 web3 相关词汇，使摘要和关键词有区分度
+WORDS = (
+    'blockchain token protocol network decentralized governance wallet liquidity staking validator '
+    'consensus contract ethereum layer rollup bridge oracle yield market community users platform '
+    'data privacy ownership revenue security audit upgrade release partners ecosystem developers '
+    'the a of and to in for on with as by is are was be this that from at it new more'
+).split()
+
+
+def _sentence(rng):
+    words = rng.choices(WORDS, k=rng.randint(8, 24))
+    return ' '.join(words).capitalize() + rng.choice('..!?')
+
+
+def entry_html(rng, media_base, paragraphs=12, images=4, links=3, tracking_pixel=True):
+    """
+    生成一篇条目正文，结构接近 Medium 输出的 HTML
+    :param rng: random.Random 实例，保证相同参数生成相同内容
+    :param media_base: 图片地址前缀，指向桩服务器的 /media/
+    :param paragraphs: 段落数
+    :param images: 图片数，其中约四分之一是多篇文章共用的图片
+    :param links: 每段中的链接数上限
+    :param tracking_pixel: 是否在末尾附加 1x1 的统计像素
+    :return: HTML 字符串
+    """
+    parts = []
+    image_slots = set(rng.sample(range(paragraphs), min(images, paragraphs)))
+    for i in range(paragraphs):
+        if i in image_slots:
+            if rng.random() < 0.25:
+                name = f'shared-{rng.randint(0, 9)}.png'
+            else:
+                name = f'{rng.getrandbits(64):016x}.png'
+            parts.append(f'<figure><img alt="" src="{media_base}{name}" /></figure>')
+
+        sentences = [_sentence(rng) for _ in range(rng.randint(3, 7))]
+        for _ in range(rng.randint(0, links)):
+            index = rng.randrange(len(sentences))
+            sentences[index] = f'<a href="https://example.com/{rng.getrandbits(32):08x}">{sentences[index]}</a>'
+        parts.append('<p>' + ' '.join(sentences) + '</p>')
+
+    if tracking_pixel:
+        # 保持 Medium 统计像素的路径形式，但指向本地，避免离线运行时访问外网
+        parts.append(f'<img src="{media_base}_/stat?event=post.clientViewed&amp;postId={rng.getrandbits(48):012x}"'
+                     f' width="1" height="1" alt="">')
+    return ''.join(parts)
+
+
+def rss_feed(name, entries=20, seed=0, media_base='http://127.0.0.1/media/', **entry_options):
+    """
+    生成 RSS 2.0 feed
+    :param name: feed 名称，用于标题和条目链接
+    :param entries: 条目数
+    :param seed: 随机种子
+    :param media_base: 图片地址前缀
+    :param entry_options: 传给 entry_html 的参数
+    :return: XML 字符串
+    """
+    rng = random.Random(f'{name}-{seed}')
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(entries):
+        title = escape(f'{name} post {i}: ' + _sentence(rng)[:60])
+        published = format_datetime(now - timedelta(hours=i * 6))
+        tags = ''.join(f'<category>{escape(tag)}</category>' for tag in rng.sample(WORDS[:24], 3))
+        body = entry_html(rng, media_base, **entry_options)
+        items.append(f'''<item>
+<title>{title}</title>
+<link>https://medium.com/{name}/post-{i}</link>
+<guid isPermaLink="false">https://medium.com/p/{name}-{i}</guid>
+{tags}
+<dc:creator>{escape(name)} author</dc:creator>
+<pubDate>{published}</pubDate>
+<content:encoded><![CDATA[{body}]]></content:encoded>
+</item>''')
+
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+<channel>
+<title>{escape(name)}</title>
+<link>https://medium.com/{name}</link>
+<description>Synthetic feed {escape(name)}</description>
+<ttl>120</ttl>
+{''.join(items)}
+</channel>
+</rss>'''
+
+
+def atom_feed(name, entries=20, seed=0, media_base='http://127.0.0.1/media/', **entry_options):
+    """
+    生成 Atom feed，参数同 rss_feed
+    :return: XML 字符串
+    """
+    rng = random.Random(f'{name}-{seed}')
+    now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(entries):
+        title = escape(f'{name} post {i}: ' + _sentence(rng)[:60])
+        published = (now - timedelta(hours=i * 6)).isoformat()
+        tags = ''.join(f'<category term="{escape(tag)}"/>' for tag in rng.sample(WORDS[:24], 3))
+        body = escape(entry_html(rng, media_base, **entry_options))
+        items.append(f'''<entry>
+<title>{title}</title>
+<link href="https://mirror.xyz/{name}/{i}"/>
+<id>https://mirror.xyz/{name}/{i}</id>
+{tags}
+<author><name>{escape(name)} author</name></author>
+<published>{published}</published>
+<updated>{published}</updated>
+<summary type="html">{body}</summary>
+</entry>''')
+
+    return f'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<title>{escape(name)}</title>
+<id>https://mirror.xyz/{name}</id>
+<updated>{now.isoformat()}</updated>
+{''.join(items)}
+</feed>'''
+
+
+def corpus(feeds=10, entries=20, seed=0, media_base='http://127.0.0.1/media/', atom_ratio=0.3, **entry_options):
+    """
+    生成一组 feed
+    :param feeds: feed 数量
+    :param entries: 每个 feed 的条目数
+    :param atom_ratio: Atom 格式所占比例，其余为 RSS
+    :return: {feed 名称: XML 字符串}
+    """
+    result = {}
+    atom_count = int(feeds * atom_ratio)
+    for i in range(feeds):
+        name = f'feed{i:04d}'
+        build = atom_feed if i < atom_count else rss_feed
+        result[name] = build(name, entries=entries, seed=seed, media_base=media_base, **entry_options)
+    return result
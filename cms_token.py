@@ -1,13 +1,30 @@
 import base64
 import json
+import logging
 import threading
 import time
 
-import requests
 from gmssl import sm2
 
+import http_client
+import metrics
 from config_load import CONFIG
 
+logger = logging.getLogger(__name__)
+
+
+def _encrypt_with(sm2_crypt, data):
+    enc_data = sm2_crypt.encrypt(data.encode())
+
+    # 把加密后的数据转为16进制字符串
+    enc_hex = enc_data.hex()
+
+    # 拼接 '04'（表示非压缩格式的公钥/加密数据）
+    enc_with_prefix = '04' + enc_hex
+
+    # 转为 Base64 编码
+    return base64.b64encode(bytes.fromhex(enc_with_prefix)).decode()
+
 
 def encrypt_data(data, public_key):
     """
@@ -19,77 +36,126 @@ def encrypt_data(data, public_key):
 
     # SM2加密
     sm2_crypt = sm2.CryptSM2(public_key=public_key, private_key=None, mode=1)
-    enc_data = sm2_crypt.encrypt(data.encode())
+    return _encrypt_with(sm2_crypt, data)
 
-    # 把加密后的数据转为16进制字符串
-    enc_hex = enc_data.hex()
 
-    # 拼接 '04'（表示非压缩格式的公钥/加密数据）
-    enc_with_prefix = '04' + enc_hex
+class _CipherCache:
+    """缓存 CMS 公钥及对应的 SM2 加密对象，登录失败时作废，下次登录重新获取"""
 
-    # 转为 Base64 编码
-    enc_base64 = base64.b64encode(bytes.fromhex(enc_with_prefix)).decode()
+    def __init__(self):
+        self._sm2_crypt = None
+        self._lock = threading.Lock()
+
+    def encrypt(self, data):
+        with self._lock:
+            if self._sm2_crypt is None:
+                self._sm2_crypt = sm2.CryptSM2(public_key=get_public_key(), private_key=None, mode=1)
+            sm2_crypt = self._sm2_crypt
+        return _encrypt_with(sm2_crypt, data)
 
-    return enc_base64
+    def invalidate(self):
+        with self._lock:
+            self._sm2_crypt = None
 
 
 class TokenCache:
+    """
+    进程内共享的 token 提供者。
+
+    token 有效时直接返回，不加锁；需要登录或刷新时只有一个线程发起请求，
+    其他线程等待并复用它的结果。后台线程在 token 到期前主动续期，
+    正常情况下调用方不会因为 token 而阻塞。
+    """
+
     def __init__(self):
         self.token = None
         self.refresh_token = None
         self.expiry_time = 0
+        self._lock = threading.Lock()
+        self._cipher = _CipherCache()
+        self._refresh_thread = None
+
+    def _is_fresh(self):
+        return self.token and time.time() < self.expiry_time - CONFIG['TOKEN_REFRESH_BUFFER']
 
     def get_token(self):
-        current_time = time.time()
-        if self.token and current_time < self.expiry_time - CONFIG['TOKEN_REFRESH_BUFFER']:
-            return self.token
+        token = self.token
+        if self._is_fresh():
+            return token
 
-        if self.token and current_time >= self.expiry_time - CONFIG['TOKEN_REFRESH_BUFFER']:
-            print("Token nearing expiry, attempting to refresh")
-            return self.refresh_token_request()
+        with self._lock:
+            # 等锁期间其他线程可能已经拿到新 token
+            if self._is_fresh():
+                return self.token
 
-        print("Fetching new token")
-        return self.fetch_new_token()
+            if self.token:
+                logger.info("Token nearing expiry, attempting to refresh")
+                token = self.refresh_token_request()
+            else:
+                logger.info("Fetching new token")
+                token = self.fetch_new_token()
+
+        if token:
+            self.start_token_refresh_in_thread()
+        return token
+
+    def renew(self):
+        """
+        在 token 仍然有效时提前续期，续期期间调用方继续使用旧 token
+        """
+        with self._lock:
+            if self.token:
+                return self.refresh_token_request()
+            return self.fetch_new_token()
+
+    def invalidate(self):
+        """
+        CMS 返回未授权时调用，作废当前 token，下次获取时重新登录
+        """
+        with self._lock:
+            self.token = None
+            self.refresh_token = None
+            self.expiry_time = 0
 
     def fetch_new_token(self):
         payload = json.dumps({
             "username": CONFIG['USERNAME'],
             #"password": CONFIG['PASSWORD']
-            "password": encrypt_data(CONFIG['PASSWORD'], get_public_key())
+            "password": self._cipher.encrypt(CONFIG['PASSWORD'])
         })
         headers = {'Content-Type': 'application/json'}
 
-        response = requests.post(CONFIG['CMS_HOST'] + CONFIG['LOGIN_PATH'], headers=headers, data=payload)
-        if response.status_code == 200:
-            data = response.json().get('result', {})
-            if data:
-                self.refresh_self(data)
-                print("New token fetched: " + self.token)
-                return self.token
-            else:
-                print("Failed to fetch token", response.text)
-                return None
-        else:
-            print("Failed to fetch token", response.text)
-            return None
+        with metrics.track('token_login') as timer:
+            response = http_client.post(CONFIG['CMS_HOST'] + CONFIG['LOGIN_PATH'], headers=headers, data=payload)
+            data = response.json().get('result', {}) if response.status_code == 200 else None
+            timer.failed = not data
+        if data:
+            self.refresh_self(data)
+            logger.info("New token fetched", extra={'expires_in': round(self.expiry_time - time.time())})
+            return self.token
+        logger.error("Failed to fetch token", extra={'status': response.status_code, 'response': response.text[:500]})
+
+        # 登录失败可能是公钥已更换，下次登录重新获取
+        self._cipher.invalidate()
+        return None
 
     def refresh_token_request(self):
         payload = json.dumps({"refreshToken": self.refresh_token})
         headers = {'Content-Type': 'application/json'}
 
-        response = requests.post(CONFIG['CMS_HOST'] + CONFIG['REFRESH_PATH'], headers=headers, data=payload)
+        with metrics.track('token_refresh') as timer:
+            response = http_client.post(CONFIG['CMS_HOST'] + CONFIG['REFRESH_PATH'], headers=headers, data=payload)
+            data = response.json().get('result', {}) if response.status_code == 200 else None
+            timer.failed = not data
+        if data:
+            self.refresh_self(data)
+            logger.info("Token refreshed", extra={'expires_in': round(self.expiry_time - time.time())})
+            return self.token
+
+        logger.error("Failed to refresh token", extra={'status': response.status_code, 'response': response.text[:500]})
         if response.status_code == 200:
-            data = response.json().get('result', {})
-            if data:
-                self.refresh_self(data)
-                print("Token refreshed: " + self.token)
-                return self.token
-            else:
-                print("Failed to refresh token", response.text)
-                return None
-        else:
-            print("Failed to refresh token", response.text)
-            return self.fetch_new_token()
+            return None
+        return self.fetch_new_token()
 
     def refresh_self(self, data):
         self.token = data.get('accessToken')
@@ -98,28 +164,49 @@ class TokenCache:
         self.expiry_time = time.time() + expires_in
 
     def start_token_refresh_loop(self):
+        retry_delay = 1
         while True:
-            self.get_token()
-            sleep_time = max(self.expiry_time - time.time() - CONFIG['TOKEN_REFRESH_BUFFER'], 1)
-            print(f"Sleeping for {sleep_time} seconds")
+            # 比调用方的刷新阈值再提前 TOKEN_RENEW_MARGIN 秒续期
+            renew_at = self.expiry_time - CONFIG['TOKEN_REFRESH_BUFFER'] - CONFIG.get('TOKEN_RENEW_MARGIN', 60)
+            sleep_time = max(renew_at - time.time(), 1)
+            logger.debug("Token renewal scheduled", extra={'sleep_s': round(sleep_time, 1)})
             time.sleep(sleep_time)
 
+            try:
+                token = self.renew()
+            except Exception as e:
+                logger.error("Failed to renew token", extra={'error': str(e)})
+                token = None
+
+            if token:
+                retry_delay = 1
+            else:
+                # 续期失败时退避重试，避免在 token 仍有效时频繁请求
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+
+    def start_token_refresh_in_thread(self):
+        if self._refresh_thread is not None:
+            return
+        with self._lock:
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self.start_token_refresh_loop, daemon=True)
+                self._refresh_thread.start()
+
 
 def start_token_refresh_in_thread():
-    refresh_thread = threading.Thread(target=token_cache.start_token_refresh_loop, daemon=True)
-    refresh_thread.start()
+    token_cache.start_token_refresh_in_thread()
 
 
 def get_public_key():
     """
-    Posts an article to the backend API.
+    Fetches the CMS public key used to encrypt the login password.
     """
     url = CONFIG['CMS_HOST'] + CONFIG['PUBLIC-KEY_PATH']
 
-    response = requests.get(url)
+    response = http_client.get(url)
     return response.text
 
 
-# 启动 token 刷新循环
+# 进程内唯一的 token 提供者，首次获取 token 后启动后台续期线程
 token_cache = TokenCache()
-start_token_refresh_in_thread()
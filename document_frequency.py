@@ -0,0 +1,83 @@
+import hashlib
+
+from local_store import SQLiteStore
+from util import LazyModule
+
+np = LazyModule('numpy')
+
+# SQLite 单条语句的参数个数上限较低，IN 查询按批执行
+_QUERY_BATCH = 500
+
+
+class DocumentFrequencyStore(SQLiteStore):
+    """语料库的文档频率统计：每个词出现在多少篇文章中，随文章处理增量更新
+
+    只保存 词 -> 文档频率 和文章总数，不保存每篇文章的词表，更新和查询的开销只与文章长度有关。
+    同一篇文章（按正文哈希）只计入一次，重试或重复处理不会放大统计。
+    """
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS document_frequency (
+               term TEXT PRIMARY KEY,
+               df INTEGER NOT NULL
+           ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS counted_documents (
+               doc_hash BLOB PRIMARY KEY
+           ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS corpus_stats (
+               name TEXT PRIMARY KEY,
+               value INTEGER NOT NULL
+           ) WITHOUT ROWID''',
+    )
+
+    def add_document(self, terms, text=None):
+        """
+        把一篇文章计入统计
+        :param terms: 文章的词列表，重复的词只计一次
+        :param text: 文章正文，用于识别已计入的文章，为 None 时按词集合识别
+        :return: 是否新计入（已计入过的文章返回 False）
+        """
+        unique_terms = sorted(set(terms))
+        if not unique_terms:
+            return False
+        source = text if text is not None else '\n'.join(unique_terms)
+        doc_hash = hashlib.blake2b(source.encode('utf-8'), digest_size=16).digest()
+
+        with self._lock, self._conn:
+            if self._conn.execute('INSERT OR IGNORE INTO counted_documents (doc_hash) VALUES (?)',
+                                  (doc_hash,)).rowcount == 0:
+                return False
+            self._conn.executemany(
+                'INSERT INTO document_frequency (term, df) VALUES (?, 1) ON CONFLICT(term) DO UPDATE SET df = df + 1',
+                [(term,) for term in unique_terms]
+            )
+            self._conn.execute(
+                "INSERT INTO corpus_stats (name, value) VALUES ('documents', 1) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+            )
+        return True
+
+    def document_count(self):
+        rows = self.query("SELECT value FROM corpus_stats WHERE name = 'documents'")
+        return rows[0][0] if rows else 0
+
+    def frequencies(self, terms):
+        """
+        :param terms: 词列表
+        :return: 与 terms 顺序一致的文档频率数组，未出现过的词为 0
+        """
+        terms = list(terms)
+        found = {}
+        for start in range(0, len(terms), _QUERY_BATCH):
+            batch = terms[start:start + _QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self.query(f'SELECT term, df FROM document_frequency WHERE term IN ({placeholders})', batch))
+        return np.array([found.get(term, 0) for term in terms], dtype=np.float64)
+
+    def idf(self, terms):
+        """
+        平滑的逆文档频率 log((N + 1) / (df + 1)) + 1，语料为空时所有词均为 1，即退化为词频
+        :return: 与 terms 顺序一致的数组
+        """
+        documents = self.document_count()
+        return np.log((documents + 1) / (self.frequencies(terms) + 1)) + 1
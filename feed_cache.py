@@ -0,0 +1,51 @@
+import time
+
+from local_store import SQLiteStore
+
+
+class FeedValidatorStore(SQLiteStore):
+    """保存每个 feed 最近一次响应的 ETag / Last-Modified，用于条件请求"""
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS feed_validators (
+               feed_url TEXT PRIMARY KEY,
+               etag TEXT,
+               last_modified TEXT,
+               updated_at REAL NOT NULL
+           )''',
+    )
+
+    def conditional_headers(self, feed_url):
+        """
+        根据已保存的校验值生成条件请求头
+        :param feed_url: feed 地址
+        :return: 包含 If-None-Match / If-Modified-Since 的请求头字典，没有记录时为空字典
+        """
+        rows = self.query('SELECT etag, last_modified FROM feed_validators WHERE feed_url = ?', (feed_url,))
+        if not rows:
+            return {}
+
+        etag, last_modified = rows[0]
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def save(self, feed_url, response):
+        """
+        记录响应中的校验值，响应没有任何校验值时删除旧记录
+        :param feed_url: feed 地址
+        :param response: requests 的响应对象
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            self.execute('DELETE FROM feed_validators WHERE feed_url = ?', (feed_url,))
+            return
+
+        self.execute(
+            'INSERT OR REPLACE INTO feed_validators (feed_url, etag, last_modified, updated_at) VALUES (?, ?, ?, ?)',
+            (feed_url, etag, last_modified, time.time())
+        )
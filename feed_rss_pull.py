@@ -1,88 +1,877 @@
+import logging
+import signal
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
-import feedparser
 import requests
 import schedule
-from bs4 import BeautifulSoup
 
+import http_client
+import metrics
+from article_media import upload_article_media
+from article_outbox import FAILED, POSTED, ArticleOutbox, OutboxDrainer
 from config_load import CONFIG
+from document_frequency import DocumentFrequencyStore
+from feed_cache import FeedValidatorStore
+from feed_shards import FeedLeaseStore, ShardCoordinator
+from feed_scheduler import SKIPPED, AdaptiveScheduler, FeedScheduleStore, PollResult, entry_times, poll_hint
 from html_resource_extractor import HTMLResourceExtractor
-from push_article_to_cms import post_article, check_article_title, upload
+from log_config import configure_logging
+from near_duplicates import NearDuplicateIndex
+from pipeline import Pipeline, PipelineStopped, Stage
+from profiling import profiler
+from published_index import PublishedIndex, entry_keys
+from push_article_to_cms import post_article, title_exists, iter_published_titles
+from summary_cache import SummaryCache
 from text_summarizer import TextSummarizer
-from util import struct_time_to_formatted_string
+from util import HostLimiter, Lazy, LazyModule, struct_time_to_formatted_string
 
-# 创建摘要生成器实例
-summarizer = TextSummarizer(language='english')
+# feedparser 导入约需 0.1 秒，首次解析时才导入
+feedparser = LazyModule('feedparser')
+
+logger = logging.getLogger(__name__)
+
+
+def _build_summarizer():
+    cache = SummaryCache(
+        max_entries=CONFIG.get('SUMMARY_CACHE_SIZE', 1024),
+        disk_path=CONFIG.get('SUMMARY_CACHE_DB'),
+        disk_max_entries=CONFIG.get('SUMMARY_CACHE_DISK_MAX', 100000)
+    )
+    document_frequencies = DocumentFrequencyStore(CONFIG['TERM_STATS_DB']) if CONFIG.get('TERM_STATS_DB') else None
+    return TextSummarizer(
+        language='english',
+        cache=cache,
+        process_workers=CONFIG.get('SUMMARY_PROCESS_WORKERS', 0),
+        document_frequencies=document_frequencies,
+        long_document_sentences=CONFIG.get('SUMMARY_LONG_DOC_SENTENCES', 400),
+        chunk_sentences=CONFIG.get('SUMMARY_CHUNK_SENTENCES', 200)
+    )
+
+
+# 以下对象在首次使用时创建，导入本模块不会打开数据库、写入心跳或加载分词器
+
+# 摘要生成器
+summarizer = Lazy(_build_summarizer)
 extractor = HTMLResourceExtractor()
 
+# 同一主机同时进行的 feed 请求数上限
+host_limiter = HostLimiter(CONFIG.get('FEED_PER_HOST_LIMIT', 2))
+
+# feed 的 ETag / Last-Modified 缓存，未配置时每次都完整下载
+feed_validators = Lazy(lambda: FeedValidatorStore(CONFIG['FEED_CACHE_DB']) if CONFIG.get('FEED_CACHE_DB') else None)
 
-def fetch_and_post_feeds():
+# 已发布条目的本地索引，未配置时每个条目都请求 CMS 校验标题
+published_index = Lazy(lambda: PublishedIndex(
+    CONFIG['PUBLISHED_INDEX_DB'],
+    bloom_capacity=CONFIG.get('PUBLISHED_INDEX_BLOOM_CAPACITY', 1000000)
+) if CONFIG.get('PUBLISHED_INDEX_DB') else None)
+
+# 已采集文章的 MinHash 签名，用于跳过其他 feed 转载的相同内容；未配置时不检测
+near_duplicate_index = Lazy(lambda: NearDuplicateIndex(
+    CONFIG['NEAR_DUP_DB'],
+    threshold=CONFIG.get('NEAR_DUP_THRESHOLD', 0.8),
+    num_perm=CONFIG.get('NEAR_DUP_NUM_PERM', 128),
+    shingle_size=CONFIG.get('NEAR_DUP_SHINGLE_SIZE', 3),
+    ttl=CONFIG.get('NEAR_DUP_TTL', 14 * 24 * 3600)
+) if CONFIG.get('NEAR_DUP_DB') else None)
+
+# 文章先写入发件箱，由后台线程发布；未配置时在采集线程中直接发布
+outbox = Lazy(lambda: ArticleOutbox(CONFIG['OUTBOX_DB']) if CONFIG.get('OUTBOX_DB') else None)
+
+# 多个采集进程分片处理 feed，未开启时本进程处理所有 feed
+shard = Lazy(lambda: ShardCoordinator(
+    FeedLeaseStore(CONFIG.get('FEED_LEASE_DB') or 'data/feed_leases.db'),
+    worker_id=CONFIG.get('WORKER_ID'),
+    lease_ttl=CONFIG.get('FEED_LEASE_TTL', 300),
+    claim_ttl=CONFIG.get('POST_CLAIM_TTL', 3600),
+    claim_retention=CONFIG.get('POST_CLAIM_RETENTION', 30 * 24 * 3600),
+    already_posted=lambda entry: title_exists(entry.get('title'))
+) if CONFIG.get('FEED_SHARDING') else None)
+
+
+def fetch_feed(feed_url):
     """
-    Fetches RSS feeds and posts their entries as articles.
+    Downloads and parses a single feed.
+
+    :return: (feed, response)，feed 自上次拉取后没有变化（304）时 feed 为 None
+    """
+    validators = feed_validators()
+    headers = validators.conditional_headers(feed_url) if validators else {}
+
+    with host_limiter.slot(feed_url), metrics.track('feed_fetch'):
+        response = http_client.get(feed_url, headers=headers, timeout=CONFIG.get('FEED_FETCH_TIMEOUT', 30))
+        if response.status_code == 304:
+            metrics.FEEDS.inc(outcome='not_modified')
+            return None, response
+        response.raise_for_status()
+
+    with metrics.track('feed_parse'):
+        feed = feedparser.parse(response.text)
+    metrics.FEEDS.inc(outcome='fetched')
+    return feed, response
+
+
+class _EntryText:
+    """条目正文的解析结果，近似重复检测和上传资源共用一次解析，第一次调用时才解析"""
+
+    def __init__(self, entry):
+        self.entry = entry
+        self._result = None
+
+    def __call__(self):
+        """
+        :return: (纯文本, 资源字典)，见 HTMLResourceExtractor.extract
+        """
+        if self._result is None:
+            self._result = extractor.extract(self.entry.summary if hasattr(self.entry, 'summary') else '')
+        return self._result
+
+
+def is_new_entry(entry, entry_text=None):
     """
-    for feed_url in CONFIG['feed_source']:
+    Checks whether an entry still needs to be posted, consulting the local index before the CMS.
+
+    :param entry_text: 条目的 _EntryText，之后 prepare_entry 复用其中的解析结果
+
+    :return: True 需要发布（分片模式下已占用，之后由 _post 完成或 _release_post_claim 释放）；
+        False 已发布、重复或由其他采集进程处理；None 校验失败，本次不发布，留待下次拉取时重试
+    """
+    index = published_index()
+    if index is not None and index.contains(entry):
+        metrics.ENTRIES.inc(outcome='skipped_index')
+        return False
+
+    # 在请求 CMS 和上传媒体之前跳过内容几乎相同的转载
+    if is_near_duplicate(entry, entry_text):
+        return False
+
+    try:
+        with metrics.track('title_check'):
+            exists = title_exists(entry.title)
+    except Exception as e:
+        logger.warning("文章名称重复校验失败", extra={'title': entry.title, 'error': str(e)})
+        metrics.ENTRIES.inc(outcome='check_failed')
+        # 本次不发布，释放上面记录的签名，其他 feed 的副本仍可发布
+        _forget_near_duplicate(entry)
+        return None
+
+    if exists:
+        if index is not None:
+            # CMS 中已存在，记入本地索引，下次不再请求
+            index.add(entry)
+        metrics.ENTRIES.inc(outcome='skipped_exists')
+        return False
+
+    # 分片模式下在上传媒体和生成摘要之前占用条目
+    coordinator = shard()
+    if coordinator is not None:
+        try:
+            claimed = coordinator.claim_post(entry)
+        except Exception as e:
+            logger.warning("Failed to claim entry", extra={'title': entry.title, 'error': str(e)})
+            metrics.ENTRIES.inc(outcome='check_failed')
+            _forget_near_duplicate(entry)
+            return None
+        if not claimed:
+            # 其他采集进程已经发布或正在发布，与已存在的条目一样跳过
+            metrics.ENTRIES.inc(outcome='claimed_elsewhere')
+            return False
+
+    metrics.ENTRIES.inc(outcome='new')
+    return True
+
+
+def is_near_duplicate(entry, entry_text=None):
+    """
+    Checks whether the entry's text nearly matches an article already taken in, e.g. the same
+    press release arriving through another feed, and records it otherwise.
+
+    :param entry_text: 条目的 _EntryText，为 None 时在这里解析正文
+    """
+    index = near_duplicate_index()
+    keys = entry_keys(entry)
+    if index is None or not keys:
+        return False
+
+    try:
+        with metrics.track('near_dup_check'):
+            text, _ = (entry_text or _EntryText(entry))()
+            tokens = summarizer().tokenize(text)
+            # 正文太短时相似度估计不可靠
+            if len(tokens) < CONFIG.get('NEAR_DUP_MIN_TOKENS', 50):
+                return False
+            match = index.claim(keys[0], tokens, entry.get('title'))
+    except Exception as e:
+        logger.warning("Near-duplicate check failed", extra={'title': entry.get('title'), 'error': str(e)})
+        return False
+
+    if match is None:
+        return False
+    duplicate_key, duplicate_title, similarity = match
+    logger.info("Skipping near-duplicate entry", extra={'title': entry.get('title'), 'link': entry.get('link'),
+                                                        'duplicate_of': duplicate_title or duplicate_key,
+                                                        'similarity': round(similarity, 3)})
+    metrics.ENTRIES.inc(outcome='skipped_near_duplicate')
+    return True
+
+
+def _forget_near_duplicate(entry):
+    # 没有发布成功的文章不应阻止之后收到的其他副本
+    index = near_duplicate_index()
+    keys = entry_keys(entry)
+    if index is not None and keys:
+        try:
+            index.remove(keys[0])
+        except Exception as e:
+            logger.warning("Failed to remove near-duplicate record", extra={'key': keys[0], 'error': str(e)})
+
+
+def _release_post_claim(entry):
+    # 发布前出错或取消的条目释放占用，下次拉取时可以重新处理
+    coordinator = shard()
+    if coordinator is not None:
         try:
-            response = requests.get(feed_url)
-            response.raise_for_status()
-
-            feed = feedparser.parse(response.text)
-
-            print(f"Feed Title: {feed.feed.title}")
-
-            for entry in feed.entries:
-                if check_article_title(entry.title):
-
-                    content = entry.summary if hasattr(entry, 'summary') else ''
-
-                    soup = BeautifulSoup(content, 'html.parser')
-                    text = soup.get_text()
-
-                    resources_dict = extractor.extract_resources(content)
-
-                    images = []
-                    for resources_type, v in resources_dict.items():
-                        if v:
-                            for item in v:
-                                upload_url = upload(item.get("url"), resources_type)
-                                if upload_url:
-                                    images.append(upload_url)
-                                    content = content.replace(item.get("url"), upload_url)
-
-                    article = {
-                        "editorType": 1,
-                        "channelId": "9",
-                        "inputType": 3,
-                        "allowComment": True,
-                        "customs": {},
-
-                        "title": entry.title,
-                        "tagNames": [item['term'] for item in entry.tags],
-                        "publishDate": struct_time_to_formatted_string(entry.published_parsed),
-                        "author": entry.author,
-                        "text": content,
-                        'source': entry.link,
-
-                        "seoDescription": summarizer.generate_summary(text, top_n=3),
-                        "image": images[0] if images else '',
-                        "fileList": [],
-                        "imageList": [],
-                    }
-                    post_article(article)
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching {feed_url}: {e}")
+            coordinator.release_post(entry)
         except Exception as e:
-            print(f"Error parsing {feed_url}: {e}")
+            logger.warning("Failed to release post claim", extra={'title': entry.get('title'), 'error': str(e)})
+
+
+def warm_published_index():
+    """
+    Loads the titles already in the CMS into the local published index.
+    """
+    index = published_index()
+    if index is None:
+        return
+    try:
+        count = index.warm(iter_published_titles())
+        logger.info("Published index warmed", extra={'titles': count})
+    except Exception as e:
+        logger.error("Error warming published index", extra={'error': str(e)})
+
+
+def prepare_entry(entry, entry_text=None):
+    """
+    Extracts the text of a feed entry and uploads its resources.
+
+    :param entry_text: 条目的 _EntryText，校验阶段已经解析过时不再重复解析
+    :return: (替换资源地址后的正文, 纯文本, 上传后的资源地址列表)
+    """
+    content = entry.summary if hasattr(entry, 'summary') else ''
+
+    # 一次解析同时得到纯文本和资源
+    text, resources_dict = (entry_text or _EntryText(entry))()
+
+    # 并发上传资源，并一次性替换正文中的地址
+    content, images = upload_article_media(content, resources_dict)
+
+    return content, text, images
+
+
+def summarize(text):
+    """
+    Summarizes entry text, on the summarizer process pool when SUMMARY_PROCESS_WORKERS is set.
+    """
+    with metrics.track('summarize'):
+        text_summarizer = summarizer()
+        if not text_summarizer.process_workers:
+            return text_summarizer.generate_summary(text, top_n=3)
+
+        summary = text_summarizer.generate_summaries([text], top_n=3)[0]
+        if summary is None:
+            raise RuntimeError('summary generation failed')
+        return summary
+
+
+def extract_keywords(text):
+    """
+    Records the entry text in the corpus term statistics and returns its top keywords for tagNames.
+
+    :return: 关键词列表，KEYWORD_TAGS 为 0、语料库文章数不足 KEYWORD_MIN_DOCUMENTS 或出错时为空
+    """
+    try:
+        with metrics.track('keywords'):
+            text_summarizer = summarizer()
+            text_summarizer.add_document(text)
+            top_k = CONFIG.get('KEYWORD_TAGS', 0)
+            if not top_k:
+                return []
+            # 语料库太小时 idf 区分不出常见词，关键词接近按词频排序，不作为标签发布
+            store = text_summarizer.document_frequencies
+            documents = store.document_count() if store is not None else 0
+            if documents < CONFIG.get('KEYWORD_MIN_DOCUMENTS', 200):
+                return []
+            return text_summarizer.get_keywords(text, top_k=top_k)
+    except Exception as e:
+        logger.warning("Keyword extraction failed", extra={'error': str(e)})
+        return []
+
+
+def _tag_names(entry, keywords):
+    # feed 自带的分类在前，关键词补充其中没有的（不区分大小写）
+    tags = [item['term'] for item in entry.get('tags', [])]
+    seen = {tag.lower() for tag in tags}
+    for keyword in keywords:
+        if keyword.lower() not in seen:
+            seen.add(keyword.lower())
+            tags.append(keyword)
+    return tags
+
+
+def build_article(entry, content, images, summary, keywords=()):
+    """
+    Builds the CMS article payload for a feed entry.
+    """
+    return {
+        "editorType": 1,
+        "channelId": "9",
+        "inputType": 3,
+        "allowComment": True,
+        "customs": {},
+
+        "title": entry.title,
+        "tagNames": _tag_names(entry, keywords),
+        "publishDate": struct_time_to_formatted_string(entry.published_parsed),
+        "author": entry.author,
+        "text": content,
+        'source': entry.link,
+
+        "seoDescription": summary,
+        "image": images[0] if images else '',
+        "fileList": [],
+        "imageList": [],
+    }
+
+
+def post_entry(entry, entry_text=None):
+    """
+    Uploads the resources of a feed entry and posts it as an article.
+
+    :param entry_text: 条目的 _EntryText，见 prepare_entry
+    :return: 文章是否发布成功
+    """
+    try:
+        content, text, images = prepare_entry(entry, entry_text)
+        article = build_article(entry, content, images, summarize(text), extract_keywords(text))
+    except BaseException:
+        _release_post_claim(entry)
+        raise
+    return _post(entry, article)
+
+
+def _already_posted(article):
+    try:
+        return title_exists(article['title'])
+    except Exception:
+        return False
+
+
+def _on_outbox_result(item, posted):
+    # item.meta 与 feedparser 条目的 id/link/title 字段相同，可以直接作为条目使用
+    index, coordinator = published_index(), shard()
+    if posted and index:
+        index.add(item.meta)
+    if not posted:
+        _forget_near_duplicate(item.meta)
+    if coordinator is not None:
+        coordinator.finish_post(item.meta, posted)
+    if not posted:
+        metrics.ENTRIES.inc(outcome='post_failed')
+
+
+_outbox_drainer = None
+_outbox_drainer_lock = threading.Lock()
+
+
+def get_outbox_drainer():
+    """
+    Returns the outbox drainer, starting it on first use.
+    """
+    global _outbox_drainer
+    if _outbox_drainer is None:
+        with _outbox_drainer_lock:
+            if _outbox_drainer is None:
+                _outbox_drainer = OutboxDrainer(
+                    outbox(),
+                    post_article,
+                    workers=CONFIG.get('OUTBOX_WORKERS', 4),
+                    max_attempts=CONFIG.get('OUTBOX_MAX_ATTEMPTS', 8),
+                    backoff=CONFIG.get('OUTBOX_RETRY_BACKOFF', 30),
+                    backoff_max=CONFIG.get('OUTBOX_RETRY_BACKOFF_MAX', 3600),
+                    recover_after=CONFIG.get('OUTBOX_RECOVER_AFTER', 0),
+                    already_posted=_already_posted,
+                    on_result=_on_outbox_result,
+                ).start()
+    return _outbox_drainer
+
+
+def _entry_meta(entry):
+    return {'id': entry.get('id'), 'link': entry.get('link'), 'title': entry.get('title')}
+
+
+def _post(entry, article):
+    """
+    Posts an article, or queues it in the outbox when OUTBOX_DB is set.
+    The entry is added to the published index once the CMS accepts it, for queued articles
+    by the outbox result callback.
+
+    :return: 文章是否已发布或已写入发件箱；发件箱中该条目已最终失败、需要 replay 时为 False
+    """
+    coordinator = shard()
+    article_outbox = outbox()
+    if article_outbox is not None:
+        keys = entry_keys(entry)
+        entry_key = keys[0] if keys else None
+        if not article_outbox.enqueue(article, _entry_meta(entry), entry_key):
+            existing = article_outbox.status_of(entry_key)
+            if existing is not None and existing[1] in (POSTED, FAILED):
+                return _on_outbox_existing(entry, *existing)
+        if coordinator is not None:
+            # 之后由 _on_outbox_result 完成占用
+            coordinator.queue_post(entry)
+        get_outbox_drainer().notify()
+        metrics.ENTRIES.inc(outcome='queued')
+        return True
+
+    # post_article 抛出异常时不知道 CMS 是否已收到，保留占用，保证最多发布一次
+    posted = post_article(article)
+    if coordinator is not None:
+        coordinator.finish_post(entry, posted)
+    metrics.ENTRIES.inc(outcome='posted' if posted else 'post_failed')
+    index = published_index()
+    if posted and index:
+        index.add(entry)
+    if not posted:
+        _forget_near_duplicate(entry)
+        logger.warning("Failed to post article", extra={'title': entry.title, 'link': entry.get('link')})
+    return posted
+
+
+def _on_outbox_existing(entry, outbox_id, status):
+    # 发件箱中已有该条目的记录，enqueue 没有写入
+    index, coordinator = published_index(), shard()
+    if status == POSTED:
+        if index is not None:
+            index.add(entry)
+        if coordinator is not None:
+            coordinator.finish_post(entry, True)
+        metrics.ENTRIES.inc(outcome='skipped_exists')
+        return True
+
+    # 多次发布失败，需要用 article_outbox replay 重新发布，重新写入不会改变状态
+    if coordinator is not None:
+        coordinator.finish_post(entry, False)
+    _forget_near_duplicate(entry)
+    metrics.ENTRIES.inc(outcome='outbox_failed')
+    logger.warning("Article failed in outbox, replay it to post again",
+                   extra={'outbox_id': outbox_id, 'title': entry.get('title'), 'link': entry.get('link')})
+    return False
+
+
+def process_feed(feed_url):
+    """
+    Fetches one feed and posts its new entries. Errors are contained to this feed.
+
+    :return: PollResult，供自适应调度计算下次轮询时间
+    """
+    coordinator = shard()
+    if coordinator is not None and not coordinator.acquire(feed_url):
+        # 分片模式下该 feed 由其他采集进程处理，不据此调整轮询间隔
+        return SKIPPED
+    try:
+        return _process_feed(feed_url)
+    finally:
+        if coordinator is not None:
+            coordinator.done(feed_url)
+
+
+def _process_feed(feed_url):
+    try:
+        feed, response = fetch_feed(feed_url)
+        if feed is None:
+            logger.info("Feed not modified", extra={'feed': feed_url})
+            return PollResult(True, False, poll_hint(response), ())
+
+        logger.info("Feed fetched", extra={'feed': feed_url, 'title': feed.feed.title, 'entries': len(feed.entries)})
+
+        new_entries = 0
+        failed = False
+        for entry in feed.entries:
+            entry_text = _EntryText(entry)
+            is_new = is_new_entry(entry, entry_text)
+            if is_new is None:
+                failed = True
+            if not is_new:
+                continue
+            new_entries += 1
+            try:
+                posted = post_entry(entry, entry_text)
+            except Exception as e:
+                # 与流水线的 _on_job_done 相同：该条目失败，继续处理其他条目
+                metrics.ENTRIES.inc(outcome='failed')
+                _forget_near_duplicate(entry)
+                logger.error("Error processing entry", extra={'link': entry.get('link'), 'error': str(e)})
+                posted = False
+            if not posted:
+                failed = True
+
+        # 全部条目处理成功后才记录校验值，避免失败的条目因 304 被跳过
+        validators = feed_validators()
+        if validators and not failed:
+            validators.save(feed_url, response)
+        return PollResult(True, new_entries > 0, poll_hint(response, feed), entry_times(feed.entries))
+    except requests.exceptions.RequestException as e:
+        metrics.FEEDS.inc(outcome='error')
+        logger.error("Error fetching feed", extra={'feed': feed_url, 'error': str(e)})
+    except Exception as e:
+        metrics.FEEDS.inc(outcome='error')
+        logger.error("Error parsing feed", extra={'feed': feed_url, 'error': str(e)})
+    return PollResult(False, False, None, ())
+
+
+class _FeedRun:
+    """流水线模式下一个 feed 的处理进度，全部条目处理完且没有出错时才记录校验值"""
+
+    def __init__(self, feed_url, response, feed):
+        self.feed_url = feed_url
+        self.response = response
+        self.hint = poll_hint(response, feed)
+        self.entry_times = entry_times(feed.entries)
+        self.pending = 0
+        self.new_entries = 0
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def entry_new(self):
+        with self._lock:
+            self.new_entries += 1
+
+    def poll_result(self):
+        return PollResult(True, self.new_entries > 0, self.hint, self.entry_times)
+
+    def start(self, entry_count):
+        self.pending = entry_count
+        if entry_count == 0:
+            self._finish()
+
+    def entry_done(self, ok):
+        with self._lock:
+            self.failed = self.failed or not ok
+            self.pending -= 1
+            finished = self.pending == 0
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        validators, coordinator = feed_validators(), shard()
+        if not self.failed and validators:
+            validators.save(self.feed_url, self.response)
+        if coordinator is not None:
+            coordinator.done(self.feed_url)
+
+
+class _EntryJob:
+    """在流水线各阶段之间传递的条目及其中间结果"""
+
+    def __init__(self, feed_run, entry):
+        self.feed_run = feed_run
+        self.entry = entry
+        self.entry_text = _EntryText(entry)
+        self.content = None
+        self.text = None
+        self.images = []
+        self.article = None
+        # 已进入发布阶段，出错时 CMS 可能已经收到，保留分片占用
+        self.posting = False
+        self.posted = False
+        # 校验或发布失败，feed 不记录校验值
+        self.failed = False
+
+
+def _fetch_stage(feed_url, results=None):
+    """
+    :param results: 不为 None 时记录每个 feed 的轮询结果 {feed_url: PollResult 或 _FeedRun}
+    """
+    results = {} if results is None else results
+    coordinator = shard()
+    if coordinator is not None and not coordinator.acquire(feed_url):
+        results[feed_url] = SKIPPED
+        return None
+
+    # 交给 _FeedRun 之前出错时在这里结束租约，否则租约要等到过期才释放
+    try:
+        try:
+            feed, response = fetch_feed(feed_url)
+        except Exception as e:
+            metrics.FEEDS.inc(outcome='error')
+            logger.error("Error fetching feed", extra={'feed': feed_url, 'error': str(e)})
+            feed, response = None, None
+
+        if feed is None:
+            if response is not None:
+                logger.info("Feed not modified", extra={'feed': feed_url})
+                results[feed_url] = PollResult(True, False, poll_hint(response), ())
+            else:
+                results[feed_url] = PollResult(False, False, None, ())
+            if coordinator is not None:
+                coordinator.done(feed_url)
+            return None
+
+        logger.info("Feed fetched", extra={'feed': feed_url, 'title': feed.feed.get('title', feed_url),
+                                           'entries': len(feed.entries)})
+        feed_run = _FeedRun(feed_url, response, feed)
+        jobs = [_EntryJob(feed_run, entry) for entry in feed.entries]
+    except BaseException:
+        results[feed_url] = PollResult(False, False, None, ())
+        if coordinator is not None:
+            coordinator.done(feed_url)
+        raise
+
+    # 之后由 _FeedRun 在全部条目处理完时结束租约
+    results[feed_url] = feed_run
+    feed_run.start(len(jobs))
+    return jobs
+
+
+def _check_stage(job):
+    is_new = is_new_entry(job.entry, job.entry_text)
+    job.failed = is_new is None
+    if not is_new:
+        return None
+    job.feed_run.entry_new()
+    return job
+
+
+def _media_stage(job):
+    job.content, job.text, job.images = prepare_entry(job.entry, job.entry_text)
+    return job
+
+
+def _summarize_stage(job):
+    job.article = build_article(job.entry, job.content, job.images, summarize(job.text),
+                                extract_keywords(job.text))
+    return job
+
+
+def _post_stage(job):
+    job.posting = True
+    job.posted = _post(job.entry, job.article)
+    job.failed = not job.posted
+    return job
+
+
+def _on_job_done(item, error):
+    if isinstance(item, _EntryJob):
+        if isinstance(error, PipelineStopped):
+            # 没有处理完的条目不记录 feed 的校验值，下次拉取时重新处理
+            metrics.ENTRIES.inc(outcome='cancelled')
+            _forget_near_duplicate(item.entry)
+            _release_post_claim(item.entry)
+        elif error is not None:
+            metrics.ENTRIES.inc(outcome='failed')
+            _forget_near_duplicate(item.entry)
+            if not item.posting:
+                _release_post_claim(item.entry)
+            logger.error("Error processing entry", extra={'link': item.entry.get('link'), 'error': str(error)})
+        item.feed_run.entry_done(error is None and not item.failed)
+
+
+# 构建流水线后依次调用，用于插入自定义阶段，见 register_pipeline_hook
+_pipeline_hooks = []
+
+
+def register_pipeline_hook(hook):
+    """
+    Registers a callable that receives each new ingestion Pipeline before it runs,
+    e.g. ``lambda p: p.add_stage(Stage('translate', translate), after='summarize')``.
+    """
+    _pipeline_hooks.append(hook)
+
+
+def build_ingest_pipeline(results=None):
+    """
+    Builds the staged ingestion pipeline: fetch -> check -> media -> summarize -> post.
+
+    :param results: 不为 None 时，fetch 阶段在其中记录每个 feed 的轮询结果
+    """
+    queue_size = CONFIG.get('INGEST_QUEUE_SIZE', 100)
+    # 每个线程一次提交一篇文章，线程数不少于摘要进程数，进程池才能全部用上
+    summarize_workers = max(CONFIG.get('INGEST_SUMMARIZE_WORKERS', 2), CONFIG.get('SUMMARY_PROCESS_WORKERS', 0))
+    ingest_pipeline = Pipeline([
+        Stage('fetch', partial(_fetch_stage, results=results), CONFIG.get('FEED_FETCH_WORKERS', 1), queue_size,
+              fan_out=True),
+        Stage('check', _check_stage, CONFIG.get('INGEST_CHECK_WORKERS', 4), queue_size),
+        Stage('media', _media_stage, CONFIG.get('INGEST_MEDIA_WORKERS', 8), queue_size),
+        Stage('summarize', _summarize_stage, summarize_workers, queue_size),
+        Stage('post', _post_stage, CONFIG.get('INGEST_POST_WORKERS', 4), queue_size),
+    ], on_done=_on_job_done)
+
+    for hook in _pipeline_hooks:
+        hook(ingest_pipeline)
+    return ingest_pipeline
+
+
+def fetch_and_post_feeds(workers=None):
+    """
+    Fetches RSS feeds and posts their entries as articles.
+
+    :param workers: 并发处理的 feed 数，默认读取配置 FEED_FETCH_WORKERS，小于等于 1 时逐个处理
+    """
+    poll_feeds(CONFIG['feed_source'], workers)
+
+
+def poll_feeds(feed_urls, workers=None):
+    """
+    Runs one ingestion cycle over the given feeds, through the pipeline when FEED_INGEST_MODE is 'pipeline'.
+
+    :return: {feed_url: PollResult}，供自适应调度计算下次轮询时间
+    """
+    before = metrics.snapshot()
+    start = time.perf_counter()
+    try:
+        with metrics.track('cycle', profile=False):
+            return _fetch_and_post_feeds(feed_urls, workers)
+    finally:
+        metrics.log_cycle_summary(before, time.perf_counter() - start)
+
+
+def _fetch_and_post_feeds(feed_urls, workers):
+    if CONFIG.get('FEED_INGEST_MODE') == 'pipeline':
+        runs = {}
+        ingest_pipeline = build_ingest_pipeline(runs)
+        with _active_lock:
+            if _shutdown.is_set():
+                return {feed_url: SKIPPED for feed_url in feed_urls}
+            _active_pipelines.add(ingest_pipeline)
+        try:
+            ingest_pipeline.run(feed_urls)
+        finally:
+            with _active_lock:
+                _active_pipelines.discard(ingest_pipeline)
+        # 流水线提前结束时没有拉取的 feed 不在 runs 中，按未轮询处理
+        return {feed_url: runs[feed_url].poll_result() if isinstance(runs.get(feed_url), _FeedRun)
+                else runs.get(feed_url, SKIPPED) for feed_url in feed_urls}
+
+    if workers is None:
+        workers = CONFIG.get('FEED_FETCH_WORKERS', 1)
+
+    if workers <= 1:
+        return {feed_url: process_feed(feed_url) for feed_url in feed_urls}
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='feed') as executor:
+        futures = {executor.submit(process_feed, feed_url): feed_url for feed_url in feed_urls}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                logger.error("Error processing feed", extra={'feed': futures[future], 'error': str(e)})
+    return results
+
+
+# 正在运行的流水线和调度器，收到停止信号时由 stop_ingestion 结束
+_active_pipelines = set()
+_active_scheduler = None
+_active_lock = threading.Lock()
+_shutdown = threading.Event()
+
+
+def stop_ingestion():
+    """
+    Requests a graceful shutdown: running pipelines finish the stage calls in progress and report
+    their queued entries as cancelled (so no feed validators are saved for them), and the scheduler
+    stops after the current cycle.
+    """
+    with _active_lock:
+        _shutdown.set()
+        pipelines = list(_active_pipelines)
+        scheduler = _active_scheduler
+    for ingest_pipeline in pipelines:
+        ingest_pipeline.stop()
+    if scheduler is not None:
+        scheduler.stop()
+
+
+def _handle_shutdown_signal(signum, frame):
+    if _shutdown.is_set():
+        # 第二次收到信号时不再等待进行中的条目
+        raise KeyboardInterrupt
+    logger.info("Shutdown requested, finishing entries in progress", extra={'signal': signum})
+    stop_ingestion()
 
 
 def job():
-    print("Feeds fetched Start.")
-    fetch_and_post_feeds()
-    print("Feeds fetched End.")
+    logger.info("Feeds fetched Start.")
+    with profiler.cycle():
+        fetch_and_post_feeds()
+    logger.info("Feeds fetched End.")
+
+
+def poll_due_feeds(feed_urls):
+    """
+    Scheduler callback: runs one profiled ingestion cycle over the feeds that are due.
+    """
+    logger.info("Feeds fetched Start.", extra={'feeds': len(feed_urls)})
+    with profiler.cycle():
+        results = poll_feeds(feed_urls)
+    logger.info("Feeds fetched End.")
+    return results
+
+
+def build_scheduler():
+    """
+    Builds the adaptive per-feed scheduler from the config.
+    """
+    return AdaptiveScheduler(
+        CONFIG['feed_source'],
+        poll_due_feeds,
+        min_interval=CONFIG.get('FEED_POLL_MIN_INTERVAL', 900),
+        max_interval=CONFIG.get('FEED_POLL_MAX_INTERVAL', 86400),
+        default_interval=CONFIG.get('FEED_POLL_DEFAULT_INTERVAL', 7200),
+        jitter=CONFIG.get('FEED_POLL_JITTER', 0.1),
+        store=FeedScheduleStore(CONFIG['FEED_SCHEDULE_DB']) if CONFIG.get('FEED_SCHEDULE_DB') else None,
+    )
+
+
+def main():
+    """
+    Runs the ingestion loop until interrupted: logging, the metrics endpoint, then the configured scheduler.
+    """
+    configure_logging()
+    if CONFIG.get('METRICS_PORT'):
+        metrics.start_metrics_server(CONFIG['METRICS_PORT'], CONFIG.get('METRICS_HOST', '127.0.0.1'))
+
+    if CONFIG.get('PUBLISHED_INDEX_WARM_ON_START'):
+        warm_published_index()
+
+    # SIGTERM / Ctrl-C 时先结束进行中的周期，再次收到信号时立即退出
+    signal.signal(signal.SIGTERM, _handle_shutdown_signal)
+    signal.signal(signal.SIGINT, _handle_shutdown_signal)
+
+    global _active_scheduler
+    try:
+        if CONFIG.get('FEED_SCHEDULER') == 'adaptive':
+            # 每个 feed 按自身的更新频率轮询，同时到期的 feed 作为一个周期处理
+            with _active_lock:
+                _active_scheduler = build_scheduler()
+                if _shutdown.is_set():
+                    _active_scheduler.stop()
+            _active_scheduler.run()
+        else:
+            # 每两小时执行一次任务
+            schedule.every(2).hours.do(job)
 
+            while not _shutdown.is_set():
+                schedule.run_pending()
+                _shutdown.wait(1)
+    finally:
+        # 只清理已经创建的分片协调器
+        if shard.initialized() and shard() is not None:
+            shard().shutdown()
 
-# 每两小时执行一次任务
-schedule.every(2).hours.do(job)
 
-while True:
-    schedule.run_pending()
-    time.sleep(1)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
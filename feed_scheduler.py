@@ -0,0 +1,209 @@
+import calendar
+import heapq
+import logging
+import random
+import re
+import statistics
+import threading
+import time
+from collections import namedtuple
+
+from local_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+# 一次轮询的结果
+# ok: 是否成功，None 表示本次没有轮询（如由其他采集进程处理），保持当前间隔；changed: 是否出现了新条目；hint: 服务端建议的最短轮询间隔（秒），没有时为 None；
+# entry_times: feed 中条目的发布时间（epoch 秒），用于估计更新频率
+PollResult = namedtuple('PollResult', ['ok', 'changed', 'hint', 'entry_times'])
+
+# 没有轮询的 feed 的结果，不影响间隔和失败计数
+SKIPPED = PollResult(None, False, None, ())
+
+_MAX_AGE_PATTERN = re.compile(r'(?:^|,)\s*(?:s-)?max-age\s*=\s*"?(\d+)', re.IGNORECASE)
+
+
+def poll_hint(response=None, feed=None):
+    """
+    从响应头的 Cache-Control max-age 和 RSS 的 <ttl>（分钟）中取服务端建议的轮询间隔
+    :return: 秒数，都没有时为 None
+    """
+    hints = []
+    if response is not None:
+        match = _MAX_AGE_PATTERN.search(response.headers.get('Cache-Control', ''))
+        if match:
+            hints.append(int(match.group(1)))
+    if feed is not None:
+        try:
+            hints.append(int(feed.feed.get('ttl')) * 60)
+        except (TypeError, ValueError):
+            pass
+    return max(hints) if hints else None
+
+
+def entry_times(entries):
+    """
+    :return: 条目的发布（或更新）时间，epoch 秒
+    """
+    times = []
+    for entry in entries:
+        parsed = entry.get('published_parsed') or entry.get('updated_parsed')
+        if parsed:
+            times.append(calendar.timegm(parsed))
+    return times
+
+
+def update_period(times, now, sample=10):
+    """
+    根据最近条目的发布时间估计 feed 的更新周期
+    :param times: 条目发布时间
+    :param now: 当前时间
+    :param sample: 参与估计的最近条目数
+    :return: 相邻条目间隔的中位数与最新条目距今时间的较大者，条目不足两条时为 None
+    """
+    recent = sorted((t for t in times if t <= now), reverse=True)[:sample]
+    if len(recent) < 2:
+        return None
+    gaps = [newer - older for newer, older in zip(recent, recent[1:])]
+    # 很久没有更新的 feed 按距今时间估计，避免因过去的高频更新而频繁轮询
+    return max(statistics.median(gaps), now - recent[0])
+
+
+class FeedScheduleStore(SQLiteStore):
+    """保存每个 feed 的下次轮询时间和当前间隔，重启后按原计划继续，不会集中轮询"""
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS feed_schedule (
+               feed_url TEXT PRIMARY KEY,
+               next_poll REAL NOT NULL,
+               interval REAL NOT NULL,
+               failures INTEGER NOT NULL DEFAULT 0
+           )''',
+    )
+
+    def load(self):
+        """
+        :return: {feed_url: (next_poll, interval, failures)}
+        """
+        return {row[0]: tuple(row[1:]) for row in
+                self.query('SELECT feed_url, next_poll, interval, failures FROM feed_schedule')}
+
+    def save(self, feed_url, next_poll, interval, failures):
+        self.execute(
+            'INSERT OR REPLACE INTO feed_schedule (feed_url, next_poll, interval, failures) VALUES (?, ?, ?, ?)',
+            (feed_url, next_poll, interval, failures)
+        )
+
+
+class AdaptiveScheduler:
+    """按 feed 独立调度轮询：每个 feed 根据自身的更新频率和服务端提示决定下次轮询时间
+
+    - 成功轮询后，间隔取估计更新周期的一半（每个周期至少轮询两次）；
+      无法估计时出现新条目则减半，否则放大 1.5 倍
+    - 不短于服务端的 ttl / max-age，并限制在 [min_interval, max_interval] 内
+    - 失败时间隔加倍退避
+    - 下次轮询时间加入随机抖动，首次轮询在 min_interval 内随机分散，负载在时间上均匀分布
+    - 同时到期的 feed 合并为一批交给 poll，作为一个采集周期处理；同一时间只有一个周期在运行，
+      周期内 feed 的并发由 poll 自身控制
+    """
+
+    def __init__(self, feed_urls, poll, min_interval=900, max_interval=86400, default_interval=7200,
+                 jitter=0.1, store=None):
+        """
+        Args:
+            feed_urls (list): feed 地址
+            poll (callable): poll(feed_urls) -> {feed_url: PollResult}，处理一批到期的 feed
+            min_interval (float): 最短轮询间隔（秒）
+            max_interval (float): 最长轮询间隔（秒）
+            default_interval (float): 没有历史记录的 feed 的初始间隔（秒）
+            jitter (float): 间隔的随机抖动比例，0.1 表示 ±10%
+            store (FeedScheduleStore): 持久化调度状态，None 时只保存在内存中
+        """
+        self.poll = poll
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.default_interval = min(max(default_interval, self.min_interval), self.max_interval)
+        self.jitter = jitter
+        self.store = store
+
+        self._stop = threading.Event()
+        self._state = {}
+        self._heap = []
+
+        saved = store.load() if store is not None else {}
+        now = time.time()
+        for feed_url in dict.fromkeys(feed_urls):
+            if feed_url in saved:
+                next_poll, interval, failures = saved[feed_url]
+            else:
+                next_poll, interval, failures = now + random.uniform(0, self.min_interval), self.default_interval, 0
+            self._state[feed_url] = (interval, failures)
+            heapq.heappush(self._heap, (next_poll, feed_url))
+
+    def next_interval(self, interval, failures, result, now):
+        """
+        根据本次轮询结果计算下一个间隔（不含抖动）
+        :return: (间隔, 连续失败次数)
+        """
+        if result.ok is None:
+            return interval, failures
+        if not result.ok:
+            return min(max(interval, self.min_interval) * 2, self.max_interval), failures + 1
+
+        period = update_period(result.entry_times or (), now)
+        if period:
+            interval = period / 2
+        elif result.changed:
+            interval = interval / 2
+        else:
+            interval = interval * 1.5
+
+        if result.hint:
+            interval = max(interval, result.hint)
+        return min(max(interval, self.min_interval), self.max_interval), 0
+
+    def _jittered(self, interval):
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _run_batch(self, feed_urls):
+        try:
+            results = self.poll(feed_urls) or {}
+        except Exception as e:
+            logger.error("Feed poll failed", extra={'feeds': len(feed_urls), 'error': str(e)})
+            results = {}
+
+        now = time.time()
+        for feed_url in feed_urls:
+            result = results.get(feed_url)
+            if not isinstance(result, PollResult):
+                result = PollResult(False, False, None, ())
+
+            interval, failures = self.next_interval(*self._state[feed_url], result, now)
+            next_poll = now + self._jittered(interval)
+            if self.store is not None:
+                try:
+                    self.store.save(feed_url, next_poll, interval, failures)
+                except Exception as e:
+                    logger.error("Failed to save feed schedule", extra={'feed': feed_url, 'error': str(e)})
+            logger.debug("Feed scheduled", extra={'feed': feed_url, 'interval_s': round(interval),
+                                                  'failures': failures})
+            self._state[feed_url] = (interval, failures)
+            heapq.heappush(self._heap, (next_poll, feed_url))
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """
+        持续调度直到 stop() 被调用，返回前等待进行中的周期结束
+        """
+        while not self._stop.is_set():
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+            if due:
+                self._run_batch(due)
+                continue
+            # 等到下一个 feed 到期或 stop() 被调用
+            self._stop.wait(self._heap[0][0] - now if self._heap else None)
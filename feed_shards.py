@@ -0,0 +1,295 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+
+from local_store import SQLiteStore
+from published_index import entry_keys
+
+logger = logging.getLogger(__name__)
+
+# FeedLeaseStore.claim 的结果
+CLAIMED, BUSY, STALE = 'claimed', 'busy', 'stale'
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class FeedLeaseStore(SQLiteStore):
+    """多个采集进程共享的协调库：工作进程心跳、feed 租约和文章发布占用
+
+    所有进程必须访问同一个数据库文件（同一台机器或可靠支持文件锁的共享磁盘），
+    跨进程的互斥由 SQLite 的写锁保证。WAL 的共享内存索引只在同一台机器内有效，
+    因此使用回滚日志（DELETE），跨主机时 BEGIN IMMEDIATE 仍能保证互斥。
+    """
+
+    JOURNAL_MODE = 'DELETE'
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS workers (
+               worker_id TEXT PRIMARY KEY,
+               heartbeat REAL NOT NULL
+           )''',
+        '''CREATE TABLE IF NOT EXISTS feed_leases (
+               feed_url TEXT PRIMARY KEY,
+               worker_id TEXT,
+               expires_at REAL NOT NULL
+           )''',
+        '''CREATE TABLE IF NOT EXISTS post_claims (
+               entry_key TEXT PRIMARY KEY,
+               worker_id TEXT NOT NULL,
+               status TEXT NOT NULL,
+               claimed_at REAL NOT NULL
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_post_claims_claimed_at ON post_claims (claimed_at)',
+    )
+
+    def heartbeat(self, worker_id, now):
+        self.execute('INSERT OR REPLACE INTO workers (worker_id, heartbeat) VALUES (?, ?)', (worker_id, now))
+
+    def live_workers(self, since):
+        return [row[0] for row in self.query('SELECT worker_id FROM workers WHERE heartbeat >= ?', (since,))]
+
+    def remove_worker(self, worker_id):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM workers WHERE worker_id = ?', (worker_id,))
+            self._conn.execute('UPDATE feed_leases SET worker_id = NULL, expires_at = 0 WHERE worker_id = ?',
+                               (worker_id,))
+
+    def acquire(self, feed_url, worker_id, now, ttl):
+        """
+        租约空闲、已过期或已由本进程持有时获取（续期），返回是否成功
+        """
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR IGNORE INTO feed_leases (feed_url, worker_id, expires_at) VALUES (?, NULL, 0)',
+                               (feed_url,))
+            return self._conn.execute(
+                '''UPDATE feed_leases SET worker_id = ?, expires_at = ?
+                   WHERE feed_url = ? AND (worker_id = ? OR worker_id IS NULL OR expires_at < ?)''',
+                (worker_id, now + ttl, feed_url, worker_id, now)
+            ).rowcount == 1
+
+    def release(self, feed_url, worker_id):
+        self.execute('UPDATE feed_leases SET worker_id = NULL, expires_at = 0 WHERE feed_url = ? AND worker_id = ?',
+                     (feed_url, worker_id))
+
+    def claim(self, keys, worker_id, now, stale_before=0, take_over=False):
+        """
+        在一个事务中占用条目的所有键，任意一个键已发布、已入队或仍在占用期内时不占用
+
+        :param stale_before: 早于该时间且仍为 claimed 的占用视为失效（占用进程在发布过程中崩溃或出错）
+        :param take_over: 是否接管失效的占用，调用方应先确认文章确实没有发布
+        :return: CLAIMED 占用成功；BUSY 其他进程已经发布或正在发布；STALE 只有失效的占用，未接管
+        """
+        with self._lock, self._conn:
+            placeholders = ','.join('?' * len(keys))
+            # 以写事务开始，保证检查和插入之间没有其他进程插入
+            self._conn.execute('BEGIN IMMEDIATE')
+            rows = self._conn.execute(f'SELECT status, claimed_at FROM post_claims WHERE entry_key IN ({placeholders})',
+                                      keys).fetchall()
+            if any(status != 'claimed' or claimed_at >= stale_before for status, claimed_at in rows):
+                return BUSY
+            if rows and not take_over:
+                return STALE
+            self._conn.execute(f'DELETE FROM post_claims WHERE entry_key IN ({placeholders})', keys)
+            self._conn.executemany(
+                'INSERT INTO post_claims (entry_key, worker_id, status, claimed_at) VALUES (?, ?, ?, ?)',
+                [(key, worker_id, 'claimed', now) for key in keys]
+            )
+            return CLAIMED
+
+    def queue_claim(self, keys):
+        """
+        文章已写入发件箱，由发件箱负责发布，占用不再按 claimed 过期
+        """
+        placeholders = ','.join('?' * len(keys))
+        self.execute(f"UPDATE post_claims SET status = 'queued' WHERE entry_key IN ({placeholders})", keys)
+
+    def finish_claim(self, keys, posted):
+        """
+        发布成功时标记为 posted；明确失败时删除占用，之后可以重试
+        """
+        placeholders = ','.join('?' * len(keys))
+        if posted:
+            self.execute(f"UPDATE post_claims SET status = 'posted' WHERE entry_key IN ({placeholders})", keys)
+        else:
+            self.execute(f"DELETE FROM post_claims WHERE entry_key IN ({placeholders}) AND status != 'posted'", keys)
+
+    def prune_claims(self, before):
+        """
+        删除早于该时间的占用记录，返回删除的行数
+        """
+        return self.execute('DELETE FROM post_claims WHERE claimed_at < ?', (before,))
+
+
+def _rendezvous_owner(feed_url, workers):
+    """最高随机权重哈希：工作进程增减时只有少量 feed 改变归属"""
+    return max(workers, key=lambda worker: hashlib.sha256(f'{worker}|{feed_url}'.encode()).digest())
+
+
+class ShardCoordinator:
+    """把 feed 分配给存活的采集进程，并保证每篇文章在所有进程中最多发布一次
+
+    - 每个进程定期写入心跳，心跳在 lease_ttl 内的进程视为存活
+    - feed 按最高随机权重哈希归属到一个存活进程，该进程获取有过期时间的租约后才处理
+    - 进程加入时，原持有者在空闲时释放不再归属自己的租约；进程退出或失联时，
+      其租约过期后由新的归属进程接管
+    - 处理条目前按条目键占用，占用成功的进程才发布；发布过程中进程崩溃或出错的条目保持占用，
+      超过 claim_ttl 后按 CMS 中是否已有该文章标记为已发布或由新的进程接管
+    - 占用记录保留 claim_retention 秒后删除
+    """
+
+    def __init__(self, store, worker_id=None, lease_ttl=300, claim_ttl=3600, claim_retention=30 * 24 * 3600,
+                 already_posted=None):
+        """
+        Args:
+            store (FeedLeaseStore): 共享协调库
+            worker_id (str): 本进程的标识，默认为 主机名-进程号
+            lease_ttl (float): 心跳和租约的有效期（秒），后台线程每 lease_ttl/3 续期一次
+            claim_ttl (float): 占用后未完成发布的有效期（秒），应长于单个条目的处理时间
+            claim_retention (float): 占用记录的保留时间（秒），0 表示不删除
+            already_posted (callable): already_posted(entry) -> bool，接管失效的占用前检查文章是否其实已经发布；
+                为 None 时失效的占用不会被接管
+        """
+        self.store = store
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.claim_ttl = claim_ttl
+        self.claim_retention = claim_retention
+        self.already_posted = already_posted
+        self._pruned_at = 0
+
+        self._held = set()
+        self._busy = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.store.heartbeat(self.worker_id, time.time())
+
+    def _owner(self, feed_url, now):
+        workers = set(self.store.live_workers(now - self.lease_ttl))
+        workers.add(self.worker_id)
+        return _rendezvous_owner(feed_url, sorted(workers))
+
+    def acquire(self, feed_url):
+        """
+        feed 归属本进程且获得租约时返回 True，处理结束后调用 done(feed_url)
+        """
+        self.start()
+        now = time.time()
+        if self._owner(feed_url, now) != self.worker_id:
+            return False
+        if not self.store.acquire(feed_url, self.worker_id, now, self.lease_ttl):
+            return False
+        with self._lock:
+            self._held.add(feed_url)
+            self._busy[feed_url] = self._busy.get(feed_url, 0) + 1
+        return True
+
+    def done(self, feed_url):
+        with self._lock:
+            count = self._busy.get(feed_url, 0) - 1
+            if count > 0:
+                self._busy[feed_url] = count
+            else:
+                self._busy.pop(feed_url, None)
+
+    def owned_feeds(self, feed_urls):
+        """
+        :return: 本轮由本进程处理的 feed（已获取租约）
+        """
+        return [feed_url for feed_url in feed_urls if self.acquire(feed_url)]
+
+    def claim_post(self, entry):
+        """
+        处理条目前占用，返回 False 表示其他进程已经发布或正在发布；
+        返回 True 后须调用 finish_post、queue_post 或 release_post
+        """
+        keys = entry_keys(entry)
+        if not keys:
+            return True
+        stale_before = time.time() - self.claim_ttl
+        result = self.store.claim(keys, self.worker_id, time.time(), stale_before)
+        if result != STALE or self.already_posted is None:
+            return result == CLAIMED
+
+        # 占用进程在发布过程中崩溃或 post_article 出错，与 OutboxDrainer 相同，先确认 CMS 是否已经收到
+        if self.already_posted(entry):
+            self.store.finish_claim(keys, True)
+            return False
+        logger.warning("Taking over stale post claim", extra={'worker': self.worker_id, 'title': entry.get('title')})
+        return self.store.claim(keys, self.worker_id, time.time(), stale_before, take_over=True) == CLAIMED
+
+    def queue_post(self, entry):
+        keys = entry_keys(entry)
+        if keys:
+            self.store.queue_claim(keys)
+
+    def finish_post(self, entry, posted):
+        keys = entry_keys(entry)
+        if keys:
+            self.store.finish_claim(keys, posted)
+
+    def release_post(self, entry):
+        """
+        发布前出错或取消时释放占用，之后可以重新处理
+        """
+        self.finish_post(entry, False)
+
+    def tick(self):
+        """
+        写入心跳，续期仍归属本进程的租约，释放空闲且已不归属本进程的租约，每小时删除一次过期的占用记录
+        """
+        now = time.time()
+        self.store.heartbeat(self.worker_id, now)
+        if self.claim_retention and now - self._pruned_at >= 3600:
+            self._pruned_at = now
+            pruned = self.store.prune_claims(now - self.claim_retention)
+            if pruned:
+                logger.info("Pruned post claims", extra={'worker': self.worker_id, 'count': pruned})
+        with self._lock:
+            held = list(self._held)
+            busy = set(self._busy)
+
+        for feed_url in held:
+            if self._owner(feed_url, now) == self.worker_id:
+                if self.store.acquire(feed_url, self.worker_id, now, self.lease_ttl):
+                    continue
+            elif feed_url in busy:
+                # 正在处理，处理完下次再释放
+                self.store.acquire(feed_url, self.worker_id, now, self.lease_ttl)
+                continue
+            else:
+                self.store.release(feed_url, self.worker_id)
+            with self._lock:
+                self._held.discard(feed_url)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_ttl / 3):
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error("Shard heartbeat failed", extra={'worker': self.worker_id, 'error': str(e)})
+
+    def start(self):
+        """
+        启动后台心跳线程，首次 acquire 时自动调用
+        """
+        if self._thread is not None:
+            return self
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='shard-heartbeat', daemon=True)
+                self._thread.start()
+        return self
+
+    def shutdown(self):
+        """
+        停止心跳并释放本进程的所有租约，其他进程无需等待过期即可接管
+        """
+        self._stop.set()
+        self.store.remove_worker(self.worker_id)
@@ -1,9 +1,26 @@
 import json
 import os
 import re
+from collections import namedtuple
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+from util import LazyModule
+
+# 只有旧的 extract_resources/get_text 路径使用 BeautifulSoup，首次使用时才导入
+bs4 = LazyModule('bs4')
+
+# 内嵌视频的平台
+VIDEO_PLATFORMS = ['youtube.com', 'vimeo.com', 'dailymotion.com', 'youku.com', 'bilibili.com']
+
+# 普通网页链接的扩展名，不作为资源提取
+PAGE_EXTENSIONS = ['.html', '.htm', '.php', '.asp', '.aspx', '.jsp']
+
+# CSS 中的 url(...) 引用
+CSS_URL_PATTERN = re.compile(r'url\(["\']?(.*?)["\']?\)')
+
+# 起始标签中的属性及其原始值
+ATTR_PATTERN = re.compile(r'([^\s/>="\']+)\s*=\s*(\'[^\']*\'|"[^"]*"|[^\s>]+)')
 
 
 def _extract_images(soup, resources, base_url):
@@ -14,16 +31,21 @@ def _extract_images(soup, resources, base_url):
         if src:
             full_url = urljoin(base_url, src)
             alt_text = img.get('alt', '')
-            resources['image'].append({
+            record = {
                 'url': full_url,
                 'alt': alt_text,
                 'type': 'img'
-            })
+            }
+            # 声明的尺寸，用于在下载前过滤统计像素等
+            for name in ('width', 'height'):
+                if img.get(name):
+                    record[name] = img.get(name)
+            resources['image'].append(record)
 
     # 提取CSS背景图片
     for tag in soup.find_all(style=True):
         style = tag.get('style', '')
-        urls = re.findall(r'url\(["\']?(.*?)["\']?\)', style)
+        urls = CSS_URL_PATTERN.findall(style)
         for url in urls:
             if url and not url.startswith('data:'):
                 full_url = urljoin(base_url, url)
@@ -69,9 +91,8 @@ def _extract_videos(soup, resources, base_url):
     # 提取<iframe>中的视频
     for iframe in soup.find_all('iframe'):
         src = iframe.get('src')
-        if src and any(platform in src for platform in
-                       ['youtube.com', 'vimeo.com', 'dailymotion.com', 'youku.com', 'bilibili.com']):
-            resources['videos'].append({
+        if src and any(platform in src for platform in VIDEO_PLATFORMS):
+            resources['video'].append({
                 'url': src,
                 'type': 'iframe-video'
             })
@@ -124,6 +145,194 @@ def save_resources(resources, output_file):
         return False
 
 
+# 单次解析的结果：纯文本和按类型分组的资源
+ExtractionResult = namedtuple('ExtractionResult', ['text', 'resources'])
+
+
+def _empty_resources():
+    return {
+        'image': [],
+        'video': [],
+        'audio': [],
+        'file': [],
+        'other_resource': []
+    }
+
+
+class _StreamingExtractor(HTMLParser):
+    """事件驱动的单次解析器，不构建DOM树，同时收集纯文本和资源
+
+    每条资源记录的 start/end 是资源地址在原始HTML中的字符位置（左闭右开），
+    可以直接用于替换原文中的地址。
+    """
+
+    def __init__(self, html_content, base_url, document_extensions):
+        super().__init__(convert_charrefs=True)
+        self.html_content = html_content
+        self.base_url = base_url
+        self.document_extensions = document_extensions
+        self.resources = _empty_resources()
+        self.text_parts = []
+        self._line_starts = [0] + [m.end() for m in re.finditer('\n', html_content)]
+        # script/style 中的内容不属于正文
+        self._skip_depth = 0
+        # pre/textarea 中的空白原样保留
+        self._preserve_depth = 0
+        # 当前所在的 video/audio 标签，用于归类 <source>
+        self._media = []
+        # 尚未闭合的 <a>，闭合时补全链接文本
+        self._links = []
+
+    def _attr_spans(self):
+        """计算当前起始标签中各属性原始值在HTML中的位置"""
+        raw = self.get_starttag_text()
+        line, column = self.getpos()
+        tag_start = self._line_starts[line - 1] + column
+
+        spans = {}
+        name_end = re.match(r'<[^\s/>]*', raw).end()
+        for match in ATTR_PATTERN.finditer(raw, name_end):
+            start, end = match.span(2)
+            if raw[start] in '"\'':
+                start, end = start + 1, end - 1
+            spans.setdefault(match.group(1).lower(), (tag_start + start, tag_start + end))
+        return spans
+
+    def _add(self, resource_type, record, span):
+        record['start'], record['end'] = span if span else (None, None)
+        self.resources[resource_type].append(record)
+        return record
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        spans = self._attr_spans()
+        base_url = self.base_url
+
+        if tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif tag in ('pre', 'textarea'):
+            self._preserve_depth += 1
+
+        src = attrs.get('src')
+        if tag == 'img' and src:
+            record = {
+                'url': urljoin(base_url, src),
+                'alt': attrs.get('alt') or '',
+                'type': 'img'
+            }
+            # 声明的尺寸，用于在下载前过滤统计像素等
+            for name in ('width', 'height'):
+                if attrs.get(name):
+                    record[name] = attrs[name]
+            self._add('image', record, spans.get('src'))
+
+        if attrs.get('style'):
+            self._extract_background_images(attrs['style'], spans.get('style'))
+
+        if tag in ('video', 'audio'):
+            self._media.append(tag)
+            if src:
+                self._add(tag, {'url': urljoin(base_url, src), 'type': tag}, spans.get('src'))
+            if tag == 'video' and attrs.get('poster'):
+                self._add('image', {
+                    'url': urljoin(base_url, attrs['poster']),
+                    'alt': 'video poster',
+                    'type': 'poster'
+                }, spans.get('poster'))
+        elif tag == 'source' and self._media and src:
+            media = self._media[-1]
+            self._add(media, {
+                'url': urljoin(base_url, src),
+                'type': media + '-source',
+                'format': attrs.get('type') or ''
+            }, spans.get('src'))
+        elif tag == 'iframe' and src and any(platform in src for platform in VIDEO_PLATFORMS):
+            self._add('video', {'url': src, 'type': 'iframe-video'}, spans.get('src'))
+        elif tag == 'a':
+            self._links.append((self._link_record(attrs.get('href'), spans.get('href')), len(self.text_parts)))
+        elif tag == 'link' and attrs.get('href'):
+            self._stylesheet_or_document(attrs, spans.get('href'))
+
+    def _extract_background_images(self, style, span):
+        raw_style = self.html_content[span[0]:span[1]] if span else None
+        for match in CSS_URL_PATTERN.finditer(style):
+            url = match.group(1)
+            if not url or url.startswith('data:'):
+                continue
+
+            url_span = None
+            if raw_style == style:
+                url_span = (span[0] + match.start(1), span[0] + match.end(1))
+            elif raw_style is not None and url in raw_style:
+                # 属性值中含有实体转义时，按地址原文定位
+                offset = raw_style.index(url)
+                url_span = (span[0] + offset, span[0] + offset + len(url))
+
+            self._add('image', {
+                'url': urljoin(self.base_url, url),
+                'alt': '',
+                'type': 'background-image'
+            }, url_span)
+
+    def _link_record(self, href, span):
+        if not href or href.startswith('#') or href.startswith('javascript:'):
+            return None
+
+        full_url = urljoin(self.base_url, href)
+        extension = os.path.splitext(full_url)[1].lower()
+        if extension in self.document_extensions:
+            resource_type = 'file'
+        elif extension and extension not in PAGE_EXTENSIONS:
+            resource_type = 'other_resource'
+        else:
+            return None
+
+        return self._add(resource_type, {
+            'url': full_url,
+            'text': '',
+            'type': extension[1:] if extension else 'unknown'
+        }, span)
+
+    def _stylesheet_or_document(self, attrs, span):
+        full_url = urljoin(self.base_url, attrs['href'])
+        rel = (attrs.get('rel') or '').split()
+        rel = rel[0] if rel else []
+
+        if rel == 'stylesheet' or full_url.endswith('.css'):
+            self._add('other_resource', {'url': full_url, 'type': 'css', 'rel': rel}, span)
+        elif full_url.endswith(tuple(self.document_extensions)):
+            self._add('file', {'url': full_url, 'type': os.path.splitext(full_url)[1][1:], 'rel': rel}, span)
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in ('pre', 'textarea'):
+            self._preserve_depth = max(0, self._preserve_depth - 1)
+        elif tag in ('video', 'audio') and tag in self._media:
+            while self._media.pop() != tag:
+                pass
+        elif tag == 'a' and self._links:
+            self._close_link()
+
+    def _close_link(self):
+        record, text_start = self._links.pop()
+        if record is not None:
+            record['text'] = ''.join(self.text_parts[text_start:]).strip()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if not self._preserve_depth and not data.strip(' \t\n\r\f'):
+            # 与 BeautifulSoup 一致，只含空白的文本折叠为一个换行或空格
+            data = '\n' if '\n' in data else ' '
+        self.text_parts.append(data)
+
+    def close(self):
+        super().close()
+        while self._links:
+            self._close_link()
+
+
 class HTMLResourceExtractor:
     """HTML资源提取器，用于提取HTML页面中的图片、视频、音频、文档等资源"""
 
@@ -140,7 +349,7 @@ class HTMLResourceExtractor:
         if not html_content:
             return {}
 
-        soup = BeautifulSoup(html_content, 'html.parser')
+        soup = bs4.BeautifulSoup(html_content, 'html.parser')
         resources = {
             'image': [],
             'video': [],
@@ -163,6 +372,27 @@ class HTMLResourceExtractor:
 
         return resources
 
+    def extract(self, html_content, base_url=''):
+        """单次遍历HTML，同时提取纯文本和资源
+
+        使用事件驱动的解析器，不构建DOM树。每条资源记录额外带有 start/end，
+        表示资源地址在 html_content 中的字符位置。
+
+        Args:
+            html_content (str): HTML内容
+            base_url (str): 用于补全相对地址的基础URL
+
+        Returns:
+            ExtractionResult: (text, resources)，text 与 BeautifulSoup 的 get_text() 一致
+        """
+        if not html_content:
+            return ExtractionResult('', _empty_resources())
+
+        parser = _StreamingExtractor(html_content, base_url, self.document_extensions)
+        parser.feed(html_content)
+        parser.close()
+        return ExtractionResult(''.join(parser.text_parts), parser.resources)
+
     def _extract_links(self, soup, resources, base_url):
         """提取链接中的文档和其他资源"""
         for link in soup.find_all('a'):
@@ -179,7 +409,7 @@ class HTMLResourceExtractor:
                     'text': link.text.strip(),
                     'type': extension[1:] if extension else 'unknown'
                 })
-            elif extension and extension not in ['.html', '.htm', '.php', '.asp', '.aspx', '.jsp']:
+            elif extension and extension not in PAGE_EXTENSIONS:
                 resources['other_resource'].append({
                     'url': full_url,
                     'text': link.text.strip(),
@@ -201,7 +431,7 @@ class HTMLResourceExtractor:
                         'rel': rel
                     })
                 elif full_url.endswith(tuple(self.document_extensions)):
-                    resources['documents'].append({
+                    resources['file'].append({
                         'url': full_url,
                         'type': os.path.splitext(full_url)[1][1:],
                         'rel': rel
@@ -220,7 +450,7 @@ def main():
     for resources_type, v in resources.items():
         if v:
             for item in v:
-                print(f"{resources_type}: {item.get("url")}")
+                print(f"{resources_type}: {item.get('url')}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config_load import CONFIG
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _retry_policy():
+    """
+    重试策略：连接失败对所有请求重试（请求尚未发出）；
+    读超时和 429/5xx 只对幂等方法（GET/HEAD/PUT/DELETE/OPTIONS/TRACE）重试，POST 不会被重复提交。
+    重试间隔按指数退避并加入随机抖动，服务端给出 Retry-After 时优先遵循。
+    """
+    return Retry(
+        total=CONFIG.get('HTTP_RETRY_TOTAL', 3),
+        backoff_factor=CONFIG.get('HTTP_RETRY_BACKOFF', 0.5),
+        backoff_jitter=CONFIG.get('HTTP_RETRY_JITTER', 0.5),
+        backoff_max=CONFIG.get('HTTP_RETRY_BACKOFF_MAX', 30),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _adapter(pool_maxsize):
+    return HTTPAdapter(
+        pool_connections=CONFIG.get('HTTP_POOL_CONNECTIONS', 32),
+        pool_maxsize=pool_maxsize,
+        max_retries=_retry_policy(),
+    )
+
+
+def _build_session():
+    session = requests.Session()
+
+    default_adapter = _adapter(CONFIG.get('HTTP_POOL_MAXSIZE', 16))
+    session.mount('http://', default_adapter)
+    session.mount('https://', default_adapter)
+
+    # CMS 和其他指定主机使用单独的连接池大小
+    host_pools = {CONFIG['CMS_HOST']: CONFIG.get('HTTP_CMS_POOL_MAXSIZE', 32)}
+    host_pools.update(CONFIG.get('HTTP_HOST_POOL_MAXSIZE') or {})
+    for prefix, pool_maxsize in host_pools.items():
+        session.mount(prefix.rstrip('/') + '/', _adapter(pool_maxsize))
+
+    return session
+
+
+def get_session():
+    """
+    返回进程内共享的 requests.Session，连接保持长连接并按主机复用
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request(method, url, **kwargs):
+    """
+    通过共享会话发送请求，未指定 timeout 时使用配置的默认值
+    """
+    kwargs.setdefault('timeout', (CONFIG.get('HTTP_CONNECT_TIMEOUT', 10), CONFIG.get('HTTP_READ_TIMEOUT', 60)))
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    return request('HEAD', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
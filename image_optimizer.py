@@ -0,0 +1,193 @@
+import importlib.util
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from config_load import CONFIG
+from util import Lazy, process_pool_context
+
+logger = logging.getLogger(__name__)
+
+# 输出格式 -> (Pillow 格式名, 文件后缀)
+_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+}
+# 保持原格式时能重新编码的格式，其他格式（如 GIF、SVG）原样上传
+_KEEP_FORMATS = {'JPEG': 'jpeg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+class ImageOptimizer:
+    """上传前在本地压缩图片：缩小到最大边长以内，按质量参数重新编码或转换格式，去掉 EXIF 等元数据
+
+    编码在进程池中进行，不占用下载和上传线程的 GIL。依赖 Pillow，未安装时原样上传。
+    结果不比原图小，或图片无法解码（损坏、动图、非位图）时返回原图。
+    """
+
+    def __init__(self, max_dimension=1600, output_format='webp', quality=82, min_saving=0.1, workers=2,
+                 timeout=30):
+        """
+        Args:
+            max_dimension (int): 宽和高的上限（像素），超出时按比例缩小，0 表示不缩放
+            output_format (str): 输出格式 webp / jpeg / keep，keep 表示保持原格式只重新压缩
+            quality (int): 有损编码的质量（1-95）
+            min_saving (float): 未缩放时至少减小的比例，达不到时上传原图，避免质量损失换不到体积
+            workers (int): 进程池大小，0 表示在调用线程中编码
+            timeout (float): 等待单张图片编码的超时（秒），超时后上传原图
+        """
+        if output_format not in _FORMATS and output_format != 'keep':
+            raise ValueError(f'不支持的图片格式：{output_format}')
+        self.max_dimension = max_dimension
+        self.output_format = output_format
+        self.quality = quality
+        self.min_saving = min_saving
+        self.workers = workers
+        self.timeout = timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            max_dimension=CONFIG.get('IMAGE_OPTIMIZE_MAX_DIMENSION', 1600),
+            output_format=CONFIG.get('IMAGE_OPTIMIZE_FORMAT', 'webp'),
+            quality=CONFIG.get('IMAGE_OPTIMIZE_QUALITY', 82),
+            min_saving=CONFIG.get('IMAGE_OPTIMIZE_MIN_SAVING', 0.1),
+            workers=CONFIG.get('IMAGE_OPTIMIZE_WORKERS', 2),
+            timeout=CONFIG.get('IMAGE_OPTIMIZE_TIMEOUT', 30),
+        )
+
+    def optimize(self, content, file_name):
+        """
+        :param content: 下载的图片内容
+        :param file_name: 上传使用的文件名
+        :return: (内容, 文件名)，转换格式时文件名的后缀随之修改；没有优化时原样返回
+        """
+        options = (self.max_dimension, self.output_format, self.quality, self.min_saving)
+        try:
+            if self.workers == 0:
+                result = _optimize_bytes(content, *options)
+            else:
+                pool = self._get_pool()
+                result = pool.submit(_optimize_bytes, content, *options).result(self.timeout)
+        except TimeoutError:
+            # 超时的编码仍占用一个工作进程，之后的图片会排在它后面一起超时，因此结束这些进程并重建进程池
+            logger.warning("Image optimization timed out", extra={'file_name': file_name, 'timeout_s': self.timeout})
+            self.close(pool, terminate=True)
+            return content, file_name
+        except BrokenProcessPool as e:
+            # 工作进程异常退出（如解码时内存不足），下次调用时重建进程池
+            logger.error("Image optimizer process pool broken", extra={'error': str(e)})
+            self.close(pool)
+            return content, file_name
+        except Exception as e:
+            logger.warning("Image optimization failed", extra={'file_name': file_name, 'error': str(e)})
+            return content, file_name
+
+        if result is None:
+            return content, file_name
+        optimized, extension = result
+        return optimized, f'{os.path.splitext(file_name)[0]}.{extension}'
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=process_pool_context())
+            return self._pool
+
+    def close(self, pool=None, terminate=False):
+        """
+        关闭进程池
+        :param pool: 只在当前进程池仍是该对象时关闭，避免并发超时的线程关闭刚重建的进程池；None 表示当前进程池
+        :param terminate: 是否结束工作进程，进程池中其他进行中的图片会失败并改为上传原图
+        """
+        with self._pool_lock:
+            if self._pool is None or (pool is not None and pool is not self._pool):
+                return
+            pool, self._pool = self._pool, None
+        # shutdown 不会中断正在执行的任务，卡住的编码需要结束进程才能释放
+        processes = list((getattr(pool, '_processes', None) or {}).values()) if terminate else []
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+
+def _optimize_bytes(content, max_dimension, output_format, quality, min_saving):
+    """
+    在工作进程中执行：解码、缩放、重新编码
+    :return: (新内容, 文件后缀)，不需要或无法优化时为 None
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        image = Image.open(io.BytesIO(content))
+        source_format = image.format
+        if getattr(image, 'n_frames', 1) > 1:
+            # 动图重新编码会丢帧或变大
+            return None
+        if output_format == 'keep':
+            output_format = _KEEP_FORMATS.get(source_format)
+            if output_format is None:
+                return None
+        pil_format, extension = _FORMATS[output_format]
+
+        icc_profile = image.info.get('icc_profile')
+        # 按 EXIF 方向旋转后再丢弃 EXIF，否则去掉元数据后图片方向会错
+        image = ImageOps.exif_transpose(image)
+        resized = bool(max_dimension) and max(image.size) > max_dimension
+        if resized:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        image = _convert_mode(image, pil_format)
+
+        output = io.BytesIO()
+        options = {'icc_profile': icc_profile} if icc_profile else {}
+        if pil_format == 'JPEG':
+            options.update(quality=quality, optimize=True, progressive=True)
+        elif pil_format == 'WEBP':
+            options.update(quality=quality, method=4)
+        else:
+            options.update(optimize=True)
+        # 不传 exif 参数，EXIF（拍摄设备、GPS 等）不会写入新文件
+        image.save(output, pil_format, **options)
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        # 无法识别或损坏的图片
+        return None
+
+    optimized = output.getvalue()
+    if len(optimized) >= len(content) or (not resized and len(optimized) > len(content) * (1 - min_saving)):
+        return None
+    return optimized, extension
+
+
+def _convert_mode(image, pil_format):
+    from PIL import Image
+
+    # JPEG 不支持透明通道，透明部分铺白色背景；其他格式只把调色板等模式转换为 RGB/RGBA
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if pil_format == 'JPEG':
+        if has_alpha:
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            return background
+        return image if image.mode in ('RGB', 'L') else image.convert('RGB')
+    if image.mode in ('RGB', 'RGBA', 'L', 'LA') or (pil_format == 'PNG' and image.mode == 'P'):
+        return image
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _create_optimizer():
+    if not CONFIG.get('IMAGE_OPTIMIZE', False):
+        return None
+    if importlib.util.find_spec('PIL') is None:
+        logger.warning("IMAGE_OPTIMIZE is enabled but Pillow is not installed, images are uploaded as downloaded")
+        return None
+    return ImageOptimizer.from_config()
+
+
+# 进程内共用的图片优化器，首次上传图片时创建；未开启或缺少 Pillow 时为 None
+image_optimizer = Lazy(_create_optimizer)
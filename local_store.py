@@ -0,0 +1,54 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """本地 SQLite 存储的基类，负责建库建表和跨线程串行访问
+
+    子类通过 SCHEMA 声明建表语句，通过 execute/query 读写数据。
+    """
+
+    SCHEMA = ()
+    # 默认使用 WAL，读写互不阻塞；WAL 依赖同一台机器上的共享内存，跨主机共享的库需要改用 DELETE
+    JOURNAL_MODE = 'WAL'
+
+    def __init__(self, path, journal_mode=None):
+        """
+        Args:
+            path (str): 数据库文件路径，所在目录不存在时自动创建
+            journal_mode (str): SQLite 日志模式，默认为类属性 JOURNAL_MODE
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        journal_mode = (journal_mode or self.JOURNAL_MODE).upper()
+        self._conn.execute(f'PRAGMA journal_mode={journal_mode}')
+        # 回滚日志模式下 NORMAL 在断电时可能损坏数据库，使用 FULL
+        self._conn.execute('PRAGMA synchronous=NORMAL' if journal_mode == 'WAL' else 'PRAGMA synchronous=FULL')
+        with self._conn:
+            for statement in self.SCHEMA:
+                self._conn.execute(statement)
+
+    def execute(self, sql, params=()):
+        """执行写操作并提交，返回受影响的行数"""
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).rowcount
+
+    def executemany(self, sql, seq_of_params):
+        """批量执行写操作并提交"""
+        with self._lock, self._conn:
+            self._conn.executemany(sql, seq_of_params)
+
+    def query(self, sql, params=()):
+        """执行查询，返回所有结果行"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,62 @@
+import json
+import logging
+import sys
+
+from config_load import CONFIG
+
+# LogRecord 自带的属性，其余属性都来自 extra，作为结构化字段输出
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """时间 级别 模块: 消息 key=value ...，便于 grep 和人工阅读"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = ' '.join(f'{key}={json.dumps(value, ensure_ascii=False, default=str)}'
+                          for key, value in _fields(record).items())
+        if fields:
+            # 异常堆栈放在最后
+            head, sep, tail = line.partition('\n')
+            line = f'{head} {fields}{sep}{tail}'
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志一行 JSON，便于日志系统按字段检索"""
+
+    def format(self, record):
+        payload = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        payload.update(_fields(record))
+        if record.exc_info:
+            payload['exception'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None, fmt=None):
+    """
+    配置根日志，在程序入口调用一次
+    :param level: 日志级别，默认读取配置 LOG_LEVEL
+    :param fmt: 'text' 或 'json'，默认读取配置 LOG_FORMAT
+    """
+    level = level or CONFIG.get('LOG_LEVEL', 'INFO')
+    fmt = fmt or CONFIG.get('LOG_FORMAT', 'text')
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JSONFormatter() if fmt == 'json' else KeyValueFormatter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
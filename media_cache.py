@@ -0,0 +1,101 @@
+import time
+
+from local_store import SQLiteStore
+
+
+class MediaCache(SQLiteStore):
+    """已上传媒体的本地映射：源地址 / 内容哈希 -> CMS 地址，避免重复下载和上传"""
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS media_by_url (
+               source_url TEXT NOT NULL,
+               resource_type TEXT NOT NULL,
+               cms_url TEXT NOT NULL,
+               created_at REAL NOT NULL,
+               last_used REAL NOT NULL,
+               PRIMARY KEY (source_url, resource_type)
+           )''',
+        '''CREATE TABLE IF NOT EXISTS media_by_hash (
+               content_hash TEXT NOT NULL,
+               resource_type TEXT NOT NULL,
+               cms_url TEXT NOT NULL,
+               created_at REAL NOT NULL,
+               last_used REAL NOT NULL,
+               PRIMARY KEY (content_hash, resource_type)
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_media_by_url_last_used ON media_by_url (last_used)',
+        'CREATE INDEX IF NOT EXISTS idx_media_by_hash_last_used ON media_by_hash (last_used)',
+    )
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=100000):
+        """
+        Args:
+            path (str): 数据库文件路径
+            ttl (int): 映射的有效期（秒），过期后重新上传，0 表示永不过期
+            max_entries (int): 每张表最多保留的记录数，超出时淘汰最久未使用的，0 表示不限制
+        """
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self.evict()
+
+    def lookup_url(self, source_url, resource_type):
+        """
+        按源地址查找已上传的 CMS 地址
+        :return: CMS 地址，未命中或已过期时为 None
+        """
+        return self._lookup('media_by_url', 'source_url', source_url, resource_type)
+
+    def lookup_hash(self, content_hash, resource_type):
+        """
+        按内容哈希查找已上传的 CMS 地址
+        :return: CMS 地址，未命中或已过期时为 None
+        """
+        return self._lookup('media_by_hash', 'content_hash', content_hash, resource_type)
+
+    def _lookup(self, table, column, value, resource_type):
+        rows = self.query(f'SELECT cms_url, created_at FROM {table} WHERE {column} = ? AND resource_type = ?',
+                          (value, resource_type))
+        if not rows:
+            return None
+
+        cms_url, created_at = rows[0]
+        now = time.time()
+        if self.ttl and now - created_at > self.ttl:
+            self.execute(f'DELETE FROM {table} WHERE {column} = ? AND resource_type = ?', (value, resource_type))
+            return None
+
+        self.execute(f'UPDATE {table} SET last_used = ? WHERE {column} = ? AND resource_type = ?',
+                     (now, value, resource_type))
+        return cms_url
+
+    def remember(self, source_url, resource_type, cms_url, content_hash=None):
+        """
+        记录一次成功的上传
+        :param source_url: 媒体的源地址
+        :param resource_type: 资源类型
+        :param cms_url: CMS 返回的地址
+        :param content_hash: 下载内容的 sha256，未知时为 None
+        """
+        now = time.time()
+        self.execute('INSERT OR REPLACE INTO media_by_url VALUES (?, ?, ?, ?, ?)',
+                     (source_url, resource_type, cms_url, now, now))
+        if content_hash:
+            # 相同内容已有地址时保留原记录，使后续引用都指向同一个 CMS 资源
+            self.execute('INSERT OR IGNORE INTO media_by_hash VALUES (?, ?, ?, ?, ?)',
+                         (content_hash, resource_type, cms_url, now, now))
+
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.evict()
+
+    def evict(self):
+        """删除过期记录，并把每张表裁剪到 max_entries 条"""
+        for table in ('media_by_url', 'media_by_hash'):
+            if self.ttl:
+                self.execute(f'DELETE FROM {table} WHERE created_at < ?', (time.time() - self.ttl,))
+            if self.max_entries:
+                self.execute(f'''DELETE FROM {table} WHERE rowid IN (
+                                     SELECT rowid FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                                 )''', (self.max_entries,))
@@ -0,0 +1,167 @@
+import logging
+import re
+
+import http_client
+from config_load import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# 默认拒绝的地址：统计像素和常见的广告/跟踪服务
+DEFAULT_DENY_PATTERNS = (
+    r'/_/stat\?',
+    r'://[^/]*medium\.com/_/',
+    r'://[^/]*(doubleclick\.net|google-analytics\.com|googletagmanager\.com|scorecardresearch\.com)/',
+    r'://feeds\.feedburner\.com/~r/',
+    r'://pixel\.wp\.com/',
+    r'/(pixel|beacon|tracking|spacer)\.(gif|png)(\?|$)',
+)
+
+# 各资源类型允许的 Content-Type 前缀，未列出的类型不限制
+DEFAULT_ALLOWED_TYPES = {
+    'image': ['image/', 'application/octet-stream'],
+    'audio': ['audio/', 'video/', 'application/octet-stream'],
+    'media': ['video/', 'audio/', 'application/octet-stream'],
+}
+
+# 各资源类型声明的最小宽高（像素），1x1 的统计像素低于该值
+DEFAULT_MIN_DIMENSIONS = {'image': 16}
+
+_CONTENT_RANGE_TOTAL = re.compile(r'/\s*(\d+)\s*$')
+_DIMENSION = re.compile(r'^\s*(\d+)\s*(px)?\s*$', re.IGNORECASE)
+
+
+class MediaRejected(Exception):
+    """媒体不符合下载策略，不下载也不上传"""
+
+
+def _dimension(value):
+    # 只解析像素值，百分比、auto 等视为未知
+    match = _DIMENSION.match(str(value)) if value is not None else None
+    return int(match.group(1)) if match else None
+
+
+def _size_from_headers(headers, status_code):
+    if status_code == 206:
+        match = _CONTENT_RANGE_TOTAL.search(headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class MediaPolicy:
+    """下载媒体之前的过滤策略，依次检查：
+
+    - 地址是否命中拒绝列表（统计像素、广告跟踪等）
+    - <img> 的 width/height 属性是否小于最小尺寸
+    - HEAD 请求（服务端不支持时改用 Range: bytes=0-0 的 GET）返回的类型和大小
+    - 正式下载的响应头，在读取正文之前再次检查类型和大小
+
+    每项检查返回拒绝原因，通过时返回 None；无法判断时放行。
+    """
+
+    def __init__(self, deny_patterns=DEFAULT_DENY_PATTERNS, min_dimensions=None, max_bytes=None,
+                 allowed_types=None, probe=True, probe_timeout=10):
+        """
+        Args:
+            deny_patterns (list): 拒绝的地址正则表达式
+            min_dimensions (dict): 各资源类型的最小宽高（像素），如 {'image': 16}
+            max_bytes (dict): 各资源类型的最大字节数，未列出的类型不限制
+            allowed_types (dict): 各资源类型允许的 Content-Type 前缀，未列出的类型不限制
+            probe (bool): 下载前是否发送 HEAD / Range 请求探测
+            probe_timeout (float): 探测请求的超时（秒）
+        """
+        self.deny_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in deny_patterns or ()]
+        self.min_dimensions = dict(DEFAULT_MIN_DIMENSIONS if min_dimensions is None else min_dimensions)
+        self.max_bytes = dict(max_bytes or {})
+        self.allowed_types = dict(DEFAULT_ALLOWED_TYPES if allowed_types is None else allowed_types)
+        self.probe_enabled = probe
+        self.probe_timeout = probe_timeout
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            deny_patterns=CONFIG.get('MEDIA_DENY_PATTERNS', DEFAULT_DENY_PATTERNS),
+            min_dimensions=CONFIG.get('MEDIA_MIN_DIMENSIONS'),
+            max_bytes=CONFIG.get('MEDIA_MAX_BYTES', {}),
+            allowed_types=CONFIG.get('MEDIA_ALLOWED_TYPES'),
+            probe=CONFIG.get('MEDIA_PROBE_REQUESTS', True),
+            probe_timeout=CONFIG.get('MEDIA_PROBE_TIMEOUT', 10),
+        )
+
+    def check_resource(self, resource_type, item):
+        """
+        不发送请求的检查：地址和 width/height 属性
+        :param resource_type: 资源类型
+        :param item: HTMLResourceExtractor 提取的资源记录
+        :return: 拒绝原因，通过时为 None
+        """
+        url = item.get('url') or ''
+        if url.startswith('data:'):
+            return 'inline data url'
+        for pattern in self.deny_patterns:
+            if pattern.search(url):
+                return f'denied by pattern {pattern.pattern}'
+
+        minimum = self.min_dimensions.get(resource_type)
+        if minimum:
+            for name in ('width', 'height'):
+                value = _dimension(item.get(name))
+                if value is not None and value < minimum:
+                    return f'{name} {value} below {minimum}'
+        return None
+
+    def check_headers(self, resource_type, headers, status_code=200):
+        """
+        按响应头检查类型和大小
+        :return: 拒绝原因，通过时为 None
+        """
+        allowed = self.allowed_types.get(resource_type)
+        content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if allowed and content_type and not content_type.startswith(tuple(allowed)):
+            return f'content type {content_type}'
+
+        return self.check_size(resource_type, _size_from_headers(headers, status_code))
+
+    def check_size(self, resource_type, size):
+        """
+        按实际大小检查，用于没有 Content-Length 或经过压缩编码的响应，在读取过程中累计检查
+        :param size: 字节数，未知时为 None
+        :return: 拒绝原因，通过时为 None
+        """
+        limit = self.max_bytes.get(resource_type)
+        if limit and size is not None and size > limit:
+            return f'{size} bytes over {limit}'
+        return None
+
+    def probe(self, url, resource_type):
+        """
+        下载前用 HEAD 请求探测类型和大小；HEAD 失败或没有返回这些信息时，
+        用 Range: bytes=0-0 的 GET 请求，只读取响应头
+        :return: 拒绝原因，通过或无法判断时为 None
+        """
+        if not self.probe_enabled:
+            return None
+        if not self.allowed_types.get(resource_type) and not self.max_bytes.get(resource_type):
+            # 该类型没有可检查的策略
+            return None
+
+        try:
+            response = http_client.head(url, allow_redirects=True, timeout=self.probe_timeout)
+            with response:
+                if response.status_code < 400 and (response.headers.get('Content-Type')
+                                                   or response.headers.get('Content-Length')):
+                    return self.check_headers(resource_type, response.headers)
+
+            response = http_client.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.probe_timeout)
+            with response:
+                if response.status_code < 400:
+                    return self.check_headers(resource_type, response.headers, response.status_code)
+        except Exception as e:
+            logger.debug("Media probe failed", extra={'url': url, 'error': str(e)})
+        return None
+
+
+# 进程内共用的媒体策略
+media_policy = MediaPolicy.from_config()
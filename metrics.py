@@ -0,0 +1,262 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时分桶（秒），覆盖从本地缓存命中到大文件上传
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，按标签值分别计数"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name + '_total', _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """耗时分布：按分桶累计次数，同时记录总次数和总耗时"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 标签值 -> [各分桶次数..., 总次数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self):
+        """
+        :return: {标签值元组: (次数, 总和)}
+        """
+        with self._lock:
+            return {key: (state[-2], state[-1]) for key, state in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(state) for key, state in self._values.items()}
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield self.name + '_bucket', _format_labels(self.labelnames, key, [('le', _format_value(bound))]), \
+                    cumulative
+            yield self.name + '_bucket', _format_labels(self.labelnames, key, [('le', '+Inf')]), state[-2]
+            yield self.name + '_sum', _format_labels(self.labelnames, key), state[-1]
+            yield self.name + '_count', _format_labels(self.labelnames, key), state[-2]
+
+
+class Registry:
+    """进程内的指标集合，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'web3content_stage_duration_seconds',
+    'Time spent in each ingestion stage.',
+    ['stage'])
+STAGE_ERRORS = REGISTRY.counter(
+    'web3content_stage_errors',
+    'Ingestion stage calls that raised or reported failure.',
+    ['stage'])
+ENTRIES = REGISTRY.counter(
+    'web3content_entries',
+    'Feed entries by outcome.',
+    ['outcome'])
+FEEDS = REGISTRY.counter(
+    'web3content_feeds',
+    'Feed fetches by outcome.',
+    ['outcome'])
+MEDIA = REGISTRY.counter(
+    'web3content_media',
+    'Media resources by how they were resolved.',
+    ['outcome'])
+IMAGE_BYTES = REGISTRY.counter(
+    'web3content_image_bytes',
+    'Image bytes before and after local optimization.',
+    ['stage'])
+OUTBOX = REGISTRY.counter(
+    'web3content_outbox',
+    'Outbox delivery attempts by outcome.',
+    ['outcome'])
+
+
+class _StageTimer:
+    """track() 返回的对象，调用方在没有抛出异常的失败情况下设置 failed = True"""
+
+    def __init__(self):
+        self.failed = False
+
+
+@contextmanager
+def track(stage, profile=True):
+    """
+    记录一次阶段调用的耗时，抛出异常或设置 failed 时计为失败
+    :param stage: 阶段名称，如 feed_fetch、title_check、upload
+    :param profile: 周期被 profiling 抽中时是否剖析该阶段，包含其他阶段的外层调用应为 False
+    """
+    timer = _StageTimer()
+    start = time.perf_counter()
+    try:
+        if profile:
+            with profiler.stage(stage):
+                yield timer
+        else:
+            yield timer
+    except BaseException:
+        timer.failed = True
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+        if timer.failed:
+            STAGE_ERRORS.inc(stage=stage)
+
+
+def snapshot():
+    """
+    :return: {阶段: (次数, 总耗时, 失败次数)}，用于计算一个周期内的增量
+    """
+    return {key[0]: (count, total, STAGE_ERRORS.value(stage=key[0]))
+            for key, (count, total) in STAGE_SECONDS.totals().items()}
+
+
+def log_cycle_summary(before, elapsed):
+    """
+    输出一个周期内各阶段的调用次数、失败次数和平均耗时
+    :param before: 周期开始时的 snapshot()
+    :param elapsed: 周期总耗时（秒）
+    """
+    logger.info('Cycle finished', extra={'duration_s': round(elapsed, 3)})
+    for stage, (count, total, errors) in sorted(snapshot().items()):
+        prev_count, prev_total, prev_errors = before.get(stage, (0, 0.0, 0))
+        count -= prev_count
+        if not count:
+            continue
+        total -= prev_total
+        logger.info('Stage summary', extra={
+            'stage': stage,
+            'count': count,
+            'errors': errors - prev_errors,
+            'total_s': round(total, 3),
+            'avg_ms': round(total / count * 1000, 1),
+        })
+
+
+def start_metrics_server(port, host='127.0.0.1', registry=REGISTRY):
+    """
+    在后台线程中提供 /metrics 接口，供 Prometheus 抓取
+    :return: ThreadingHTTPServer，调用 shutdown() 停止
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info('Metrics endpoint started', extra={'address': f'http://{host}:{server.server_address[1]}/metrics'})
+    return server
@@ -0,0 +1,193 @@
+import hashlib
+import random
+import time
+
+from local_store import SQLiteStore
+from util import LazyModule
+
+np = LazyModule('numpy')
+
+# MinHash 的置换函数 (a * x + b) mod p 使用的梅森素数，结果取低 32 位
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _false_positive_weight(threshold, bands, rows, steps=50):
+    # 相似度低于阈值的文档对落入同一个桶的概率积分
+    step = threshold / steps
+    return sum(1 - (1 - ((i + 0.5) * step) ** rows) ** bands for i in range(steps)) * step
+
+
+def _false_negative_weight(threshold, bands, rows, steps=50):
+    # 相似度高于阈值的文档对没有落入任何同一个桶的概率积分
+    step = (1 - threshold) / steps
+    return sum((1 - (threshold + (i + 0.5) * step) ** rows) ** bands for i in range(steps)) * step
+
+
+def lsh_params(threshold, num_perm):
+    """
+    选择 LSH 的分段数和每段行数，使误报和漏报概率之和最小
+    :param threshold: 相似度阈值
+    :param num_perm: 签名长度
+    :return: (bands, rows)，bands * rows <= num_perm
+    """
+    best, best_error = (1, num_perm), None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            error = (_false_positive_weight(threshold, bands, rows)
+                     + _false_negative_weight(threshold, bands, rows))
+            if best_error is None or error < best_error:
+                best, best_error = (bands, rows), error
+    return best
+
+
+class MinHasher:
+    """把词序列按 shingle（连续 n 个词）集合计算 MinHash 签名，两个签名相同位置相等的比例估计 Jaccard 相似度"""
+
+    def __init__(self, num_perm=128, shingle_size=3, seed=1):
+        """
+        Args:
+            num_perm (int): 签名长度（置换函数个数），越长估计越准
+            shingle_size (int): 每个 shingle 包含的词数
+            seed (int): 生成置换函数的随机种子，已保存的签名只能与相同参数的签名比较
+        """
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._a = np.array([rng.randrange(1, _MERSENNE_PRIME) for _ in range(num_perm)], dtype=np.uint64)
+        self._b = np.array([rng.randrange(0, _MERSENNE_PRIME) for _ in range(num_perm)], dtype=np.uint64)
+
+    def shingles(self, tokens):
+        size = self.shingle_size
+        return {' '.join(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+
+    def signature(self, tokens):
+        """
+        :param tokens: 词列表
+        :return: 长度为 num_perm 的 uint32 数组
+        """
+        hashes = np.array([int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest(), 'little')
+                           for shingle in self.shingles(tokens)], dtype=np.uint64)
+        # uint64 乘法溢出时按 2^64 取模，结果仍是确定的，与常见 MinHash 实现一致
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def similarity(signature1, signature2):
+        return float(np.mean(signature1 == signature2))
+
+
+class NearDuplicateIndex(SQLiteStore):
+    """已处理文章的 MinHash 签名及其 LSH 分段索引，用于发现内容几乎相同的文章
+
+    签名按 bands 段分别存入桶中，至少有一段完全相同的文章作为候选，
+    再用完整签名估计相似度，不低于阈值时视为重复。
+    """
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS near_dup_docs (
+               doc_key TEXT PRIMARY KEY,
+               signature BLOB NOT NULL,
+               title TEXT,
+               created_at REAL NOT NULL
+           )''',
+        '''CREATE TABLE IF NOT EXISTS near_dup_bands (
+               band INTEGER NOT NULL,
+               bucket BLOB NOT NULL,
+               doc_key TEXT NOT NULL,
+               PRIMARY KEY (band, bucket, doc_key)
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_near_dup_bands_doc ON near_dup_bands (doc_key)',
+        'CREATE INDEX IF NOT EXISTS idx_near_dup_docs_created_at ON near_dup_docs (created_at)',
+    )
+
+    def __init__(self, path, threshold=0.8, num_perm=128, shingle_size=3, ttl=14 * 24 * 3600):
+        """
+        Args:
+            path (str): 数据库文件路径
+            threshold (float): 估计的 Jaccard 相似度不低于该值时视为重复
+            num_perm (int): 签名长度，修改后已保存的签名不再参与比较
+            shingle_size (int): 每个 shingle 包含的词数
+            ttl (int): 签名的保留时间（秒），转载通常集中在几天内，0 表示永久保留
+        """
+        super().__init__(path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._writes = 0
+        self.evict()
+
+    def _buckets(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def _find(self, doc_key, signature, buckets):
+        conditions = ' OR '.join(['(band = ? AND bucket = ?)'] * len(buckets))
+        params = [value for bucket in buckets for value in bucket]
+        candidates = [row[0] for row in self._conn.execute(
+            f'SELECT DISTINCT doc_key FROM near_dup_bands WHERE {conditions}', params) if row[0] != doc_key]
+        if not candidates:
+            return None
+
+        placeholders = ','.join('?' * len(candidates))
+        since = time.time() - self.ttl if self.ttl else 0
+        best = None
+        for key, blob, title in self._conn.execute(
+                f'SELECT doc_key, signature, title FROM near_dup_docs WHERE doc_key IN ({placeholders}) '
+                f'AND created_at >= ?', candidates + [since]):
+            stored = np.frombuffer(blob, dtype=np.uint32)
+            if len(stored) != len(signature):
+                continue
+            similarity = MinHasher.similarity(signature, stored)
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (key, title, similarity)
+        return best
+
+    def claim(self, doc_key, tokens, title=None):
+        """
+        查找与文章内容几乎相同的已记录文章，没有时记录本文章；查找和记录在同一个事务中，
+        并发处理的两篇重复文章只有一篇能记录成功。doc_key 相同的记录（同一篇文章的重试）不算重复。
+        :param doc_key: 文章的唯一键
+        :param tokens: 正文的词列表
+        :param title: 文章标题，仅用于日志
+        :return: 重复时为 (已记录文章的 doc_key, 标题, 估计的相似度)，否则为 None
+        """
+        signature = self.hasher.signature(tokens)
+        buckets = self._buckets(signature)
+        with self._lock, self._conn:
+            # 以写事务开始，保证多个采集进程之间查找和记录之间没有其他写入
+            self._conn.execute('BEGIN IMMEDIATE')
+            match = self._find(doc_key, signature, buckets)
+            if match is not None:
+                return match
+
+            self._conn.execute('DELETE FROM near_dup_bands WHERE doc_key = ?', (doc_key,))
+            self._conn.execute('INSERT OR REPLACE INTO near_dup_docs (doc_key, signature, title, created_at) '
+                               'VALUES (?, ?, ?, ?)', (doc_key, signature.tobytes(), title, time.time()))
+            self._conn.executemany('INSERT OR IGNORE INTO near_dup_bands (band, bucket, doc_key) VALUES (?, ?, ?)',
+                                   [(band, bucket, doc_key) for band, bucket in buckets])
+
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            self.evict()
+        return None
+
+    def remove(self, doc_key):
+        """
+        删除文章的记录，用于发布失败的文章，使之后收到的其他副本可以正常发布
+        """
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM near_dup_bands WHERE doc_key = ?', (doc_key,))
+            self._conn.execute('DELETE FROM near_dup_docs WHERE doc_key = ?', (doc_key,))
+
+    def evict(self):
+        """删除超过保留时间的签名"""
+        if not self.ttl:
+            return
+        with self._lock, self._conn:
+            since = time.time() - self.ttl
+            self._conn.execute('''DELETE FROM near_dup_bands WHERE doc_key IN (
+                                      SELECT doc_key FROM near_dup_docs WHERE created_at < ?
+                                  )''', (since,))
+            self._conn.execute('DELETE FROM near_dup_docs WHERE created_at < ?', (since,))
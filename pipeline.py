@@ -0,0 +1,144 @@
+import logging
+import queue
+import threading
+
+# 放入队列表示上游已经结束
+_END = object()
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStopped(Exception):
+    """流水线被提前结束，数据没有处理完，作为 on_done 的 error 传入"""
+
+
+class Stage:
+    """流水线中的一个阶段：从输入队列取数据，处理后交给下一阶段"""
+
+    def __init__(self, name, func, workers=1, queue_size=100, fan_out=False):
+        """
+        Args:
+            name (str): 阶段名称
+            func (callable): 处理函数，接收一个数据；返回 None 表示丢弃该数据
+            workers (int): 该阶段的工作线程数
+            queue_size (int): 输入队列容量，队列满时上游阻塞，以此限制内存占用
+            fan_out (bool): 为 True 时 func 返回可迭代对象，其中每个元素分别交给下一阶段
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.fan_out = fan_out
+
+
+class Pipeline:
+    """由有界队列连接的多阶段流水线，各阶段使用独立的线程数并行处理
+
+    单条数据处理失败只会丢弃该数据，不影响其他数据。
+    """
+
+    def __init__(self, stages=None, on_done=None):
+        """
+        Args:
+            stages (list): 按顺序排列的 Stage
+            on_done (callable): 数据离开流水线时的回调 on_done(item, error)，
+                处理完最后一个阶段、被丢弃或出错时都会调用；error 为 None 表示没有出错，
+                stop() 之后未处理的数据为 PipelineStopped
+        """
+        self.stages = list(stages or [])
+        self.on_done = on_done
+        self._stop = threading.Event()
+
+    def add_stage(self, stage, after=None, before=None):
+        """
+        插入自定义阶段
+        :param stage: 要插入的 Stage
+        :param after: 插入到该名称的阶段之后
+        :param before: 插入到该名称的阶段之前；都不指定时追加到末尾
+        """
+        names = [s.name for s in self.stages]
+        if after is not None:
+            self.stages.insert(names.index(after) + 1, stage)
+        elif before is not None:
+            self.stages.insert(names.index(before), stage)
+        else:
+            self.stages.append(stage)
+
+    def stop(self):
+        """请求提前结束：不再接收新数据，队列中剩余的数据以 PipelineStopped 错误结束"""
+        self._stop.set()
+
+    def run(self, items):
+        """
+        处理所有数据，全部阶段结束后返回
+        :param items: 输入第一个阶段的数据
+        """
+        if not self.stages:
+            return
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            remaining = [stage.workers]
+            lock = threading.Lock()
+            for i in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(stage, downstream, remaining, lock),
+                                          name=f'{stage.name}-{i}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        first = self.stages[0]
+        for item in items:
+            if self._stop.is_set():
+                break
+            first.queue.put(item)
+        for _ in range(first.workers):
+            first.queue.put(_END)
+
+        for thread in threads:
+            thread.join()
+
+    def _work(self, stage, downstream, remaining, lock):
+        while True:
+            item = stage.queue.get()
+            if item is _END:
+                break
+            if self._stop.is_set():
+                self._done(item, PipelineStopped(f'pipeline stopped before stage {stage.name}'))
+                continue
+
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                logger.warning("Pipeline stage failed", extra={'stage': stage.name, 'error': str(e)})
+                self._done(item, e)
+                continue
+
+            if result is None:
+                self._done(item, None)
+            elif stage.fan_out:
+                for child in result:
+                    self._forward(child, downstream)
+            else:
+                self._forward(result, downstream)
+
+        # 本阶段最后一个退出的线程通知下游结束
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and downstream is not None:
+            for _ in range(downstream.workers):
+                downstream.queue.put(_END)
+
+    def _forward(self, item, downstream):
+        if downstream is None:
+            self._done(item, None)
+        else:
+            downstream.queue.put(item)
+
+    def _done(self, item, error):
+        if self.on_done is not None:
+            try:
+                self.on_done(item, error)
+            except Exception:
+                logger.exception("Pipeline on_done callback failed")
@@ -0,0 +1,163 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from config_load import CONFIG
+
+logger = logging.getLogger(__name__)
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class CycleProfiler:
+    """
+    按周期抽样的性能剖析：每 every 个周期中剖析一个，其余周期没有额外开销。
+
+    被抽中的周期内，每次阶段调用（metrics.track）在所在线程单独用 cProfile 记录，
+    同一线程中嵌套的阶段计入最外层阶段；周期结束后按阶段合并，
+    写出 <阶段>.prof 和包含各阶段 top-N 函数的 report.txt。
+    开启 tracemalloc 时报告中还包括周期内的峰值内存和分配最多的代码行。
+
+    进程池中计算的摘要不在剖析范围内，剖析摘要算法时可将 SUMMARY_PROCESS_WORKERS 设为 0。
+    """
+
+    def __init__(self, enabled=False, every=10, output_dir='data/profiles', top_n=30, trace_malloc=True):
+        """
+        Args:
+            enabled (bool): 是否开启
+            every (int): 每多少个周期剖析一次，1 表示每个周期都剖析
+            output_dir (str): 剖析结果目录，每个被剖析的周期一个子目录
+            top_n (int): 报告中每个阶段列出的函数数 / 分配位置数
+            trace_malloc (bool): 是否同时用 tracemalloc 跟踪内存分配
+        """
+        self.enabled = enabled
+        self.every = max(1, int(every))
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.trace_malloc = trace_malloc
+
+        self._cycles = 0
+        self._active = False
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_config(cls):
+        """
+        读取配置，环境变量 WEB3CONTENT_PROFILE / WEB3CONTENT_PROFILE_EVERY / WEB3CONTENT_PROFILE_DIR 优先
+        """
+        enabled = os.environ.get('WEB3CONTENT_PROFILE')
+        enabled = enabled.lower() in _TRUE if enabled is not None else CONFIG.get('PROFILE_ENABLED', False)
+        return cls(
+            enabled=enabled,
+            every=int(os.environ.get('WEB3CONTENT_PROFILE_EVERY') or CONFIG.get('PROFILE_EVERY_N', 10)),
+            output_dir=os.environ.get('WEB3CONTENT_PROFILE_DIR') or CONFIG.get('PROFILE_DIR', 'data/profiles'),
+            top_n=CONFIG.get('PROFILE_TOP_N', 30),
+            trace_malloc=CONFIG.get('PROFILE_TRACEMALLOC', True),
+        )
+
+    @contextmanager
+    def cycle(self):
+        """
+        包裹一个调度周期，周期被抽中时剖析其中的各阶段
+        """
+        self._cycles += 1
+        cycle_number = self._cycles
+        if not self.enabled or (cycle_number - 1) % self.every:
+            yield
+            return
+
+        with self._lock:
+            self._profiles = {}
+        tracing = self.trace_malloc and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        self._active = True
+        try:
+            yield
+        finally:
+            self._active = False
+            elapsed = time.perf_counter() - start
+            snapshot = peak = None
+            if tracing:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            with self._lock:
+                profiles, self._profiles = self._profiles, {}
+            try:
+                self._write(cycle_number, elapsed, profiles, snapshot, peak)
+            except Exception:
+                logger.exception("Failed to write profile")
+
+    @contextmanager
+    def stage(self, name):
+        """
+        在被抽中的周期内剖析一次阶段调用
+        """
+        if not self._active or getattr(self._local, 'busy', False):
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他剖析工具已占用（如 Python 3.12+ 中另一线程的 cProfile），本次不剖析
+            yield
+            return
+
+        self._local.busy = True
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.busy = False
+            with self._lock:
+                self._profiles.setdefault(name, []).append(profile)
+
+    def _write(self, cycle_number, elapsed, profiles, snapshot, peak):
+        directory = os.path.join(self.output_dir,
+                                 f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-cycle{cycle_number:05d}")
+        os.makedirs(directory, exist_ok=True)
+
+        report = io.StringIO()
+        report.write(f'cycle {cycle_number}: {elapsed:.3f}s\n')
+        if peak is not None:
+            report.write(f'peak traced memory: {peak / 1024 / 1024:.1f} MiB\n')
+
+        for name, stage_profiles in sorted(profiles.items()):
+            stats = pstats.Stats(*stage_profiles, stream=report)
+            stats.dump_stats(os.path.join(directory, f'{name}.prof'))
+
+            report.write(f'\n===== {name}: {len(stage_profiles)} calls =====\n')
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            stats.sort_stats('tottime').print_stats(self.top_n)
+
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            ])
+            report.write(f'\n===== allocations still held at end of cycle (top {self.top_n}) =====\n')
+            for statistic in snapshot.statistics('lineno')[:self.top_n]:
+                report.write(f'{statistic}\n')
+
+        with open(os.path.join(directory, 'report.txt'), 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        logger.info("Cycle profile written", extra={'cycle': cycle_number, 'path': directory})
+
+
+# 进程内唯一的剖析器，默认关闭
+profiler = CycleProfiler.from_config()
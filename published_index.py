@@ -0,0 +1,128 @@
+import hashlib
+import math
+import threading
+import time
+
+from local_store import SQLiteStore
+
+
+class BloomFilter:
+    """简单的布隆过滤器，用于在查询 SQLite 之前快速排除从未见过的键"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        """
+        Args:
+            capacity (int): 预计存放的元素个数
+            error_rate (float): 可接受的误判率
+        """
+        capacity = max(1, int(capacity))
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key):
+        with self._lock:
+            for pos in self._positions(key):
+                self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def entry_keys(entry=None, guid=None, link=None, title=None):
+    """
+    生成条目在索引中的键，GUID、链接和标题任意一个命中都视为已发布
+    :param entry: feedparser 的条目对象，提供时从中读取 guid/link/title
+    :return: 键列表
+    """
+    if entry is not None:
+        guid = entry.get('id')
+        link = entry.get('link')
+        title = entry.get('title')
+
+    keys = []
+    if guid:
+        keys.append('guid:' + guid.strip())
+    if link:
+        keys.append('link:' + link.strip())
+    if title:
+        keys.append('title:' + ' '.join(title.split()).lower())
+    return keys
+
+
+class PublishedIndex(SQLiteStore):
+    """已发布条目的本地持久索引，命中时无需再请求 CMS 校验标题"""
+
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS published_entries (
+               key TEXT PRIMARY KEY,
+               created_at REAL NOT NULL
+           )''',
+    )
+
+    def __init__(self, path, bloom_capacity=1000000, bloom_error_rate=0.001):
+        super().__init__(path)
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        for (key,) in self.query('SELECT key FROM published_entries'):
+            self.bloom.add(key)
+
+    def contains(self, entry=None, **fields):
+        """
+        判断条目是否已经发布过
+        :param entry: feedparser 的条目对象，也可以通过 guid/link/title 关键字参数传入
+        :return: 已发布返回 True
+        """
+        candidates = [key for key in entry_keys(entry, **fields) if key in self.bloom]
+        if not candidates:
+            return False
+
+        placeholders = ','.join('?' * len(candidates))
+        rows = self.query(f'SELECT 1 FROM published_entries WHERE key IN ({placeholders}) LIMIT 1', candidates)
+        return bool(rows)
+
+    def add(self, entry=None, **fields):
+        """
+        记录已发布的条目
+        :param entry: feedparser 的条目对象，也可以通过 guid/link/title 关键字参数传入
+        """
+        keys = entry_keys(entry, **fields)
+        if not keys:
+            return
+
+        now = time.time()
+        self.executemany('INSERT OR IGNORE INTO published_entries (key, created_at) VALUES (?, ?)',
+                         [(key, now) for key in keys])
+        for key in keys:
+            self.bloom.add(key)
+
+    def warm(self, titles):
+        """
+        用 CMS 中已有的文章标题预热索引
+        :param titles: 标题的可迭代对象
+        :return: 写入的标题数量
+        """
+        count = 0
+        batch = []
+        now = time.time()
+        for title in titles:
+            keys = entry_keys(title=title)
+            batch.extend((key, now) for key in keys)
+            count += 1
+            if len(batch) >= 500:
+                self._add_batch(batch)
+                batch = []
+        if batch:
+            self._add_batch(batch)
+        return count
+
+    def _add_batch(self, rows):
+        self.executemany('INSERT OR IGNORE INTO published_entries (key, created_at) VALUES (?, ?)', rows)
+        for key, _ in rows:
+            self.bloom.add(key)
@@ -1,14 +1,33 @@
+import hashlib
 import json
+import logging
 import os
+import tempfile
 from pathlib import Path
 from urllib.parse import urlparse
 
-import requests
+from requests_toolbelt import MultipartEncoder
 
-from cms_token import TokenCache
+import http_client
+import metrics
+from cms_token import token_cache
 from config_load import CONFIG
+from image_optimizer import image_optimizer
+from media_cache import MediaCache
+from media_policy import MediaRejected, media_policy
+from util import ByteBudget, Lazy
 
-token_cache = TokenCache()
+logger = logging.getLogger(__name__)
+
+# 同时处于传输中的媒体字节数上限
+media_budget = ByteBudget(CONFIG.get('MEDIA_INFLIGHT_BYTES', 0))
+
+# 已上传媒体的映射，首次上传时打开；未配置时每次都重新下载上传
+media_cache = Lazy(lambda: MediaCache(
+    CONFIG['MEDIA_CACHE_DB'],
+    ttl=CONFIG.get('MEDIA_CACHE_TTL', 30 * 24 * 3600),
+    max_entries=CONFIG.get('MEDIA_CACHE_MAX_ENTRIES', 100000)
+) if CONFIG.get('MEDIA_CACHE_DB') else None)
 
 
 def post_article(article):
@@ -24,13 +43,26 @@ def post_article(article):
         'Authorization': 'Bearer ' + token
     }
 
-    response = requests.post(url, headers=headers, data=json.dumps(article))
-    print(response.text)
+    with metrics.track('post') as timer:
+        response = http_client.post(url, headers=headers, data=json.dumps(article))
+        timer.failed = response.status_code != 200
+    _check_auth(response)
+    logger.info("Article posted", extra={'title': article.get('title'), 'status': response.status_code,
+                                         'response': response.text[:500]})
+    return response.status_code == 200
 
 
-def check_article_title(title):
+def _check_auth(response):
     """
-    check the article title is exist
+    drop the shared token when the CMS rejects it, so the next call logs in again
+    """
+    if response.status_code == 401:
+        token_cache.invalidate()
+
+
+def title_exists(title):
+    """
+    ask the CMS whether an article with this title exists, raises on request errors
     """
 
     url = CONFIG['CMS_HOST'] + CONFIG['CHECK_ARTICLE_TITLE_PATH']
@@ -41,18 +73,94 @@ def check_article_title(title):
         'Content-Type': 'application/json',
         'Authorization': 'Bearer ' + token
     }
-    try:
 
-        response = requests.get(url, headers=headers, params={'title': title})
-        return not response.json().get('data')
+    response = http_client.get(url, headers=headers, params={'title': title})
+    _check_auth(response)
+    return bool(response.json().get('data'))
+
+
+def check_article_title(title):
+    """
+    check the article title is exist
+    """
+    try:
+        return not title_exists(title)
     except Exception as e:
-        print(f"文章名称重复校验失败: {e}")
+        logger.warning("文章名称重复校验失败", extra={'title': title, 'error': str(e)})
         return False
 
 
+def iter_published_titles(page_size=100):
+    """
+    iterate over the titles of the articles already in the CMS, page by page
+    """
+    url = CONFIG['CMS_HOST'] + CONFIG.get('ARTICLE_LIST_PATH', CONFIG['NEW_ARTICLE_PATH'])
+
+    page = 1
+    while True:
+        token = token_cache.get_token()
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Bearer ' + token
+        }
+        response = http_client.get(url, headers=headers, params={'pageNum': page, 'pageSize': page_size})
+        response.raise_for_status()
+
+        payload = response.json()
+        records = payload.get('data') or payload.get('result') or []
+        if isinstance(records, dict):
+            # 分页接口通常把列表放在 records / list 字段中
+            records = records.get('records') or records.get('list') or []
+        if not records:
+            return
+
+        for record in records:
+            if record.get('title'):
+                yield record['title']
+
+        if len(records) < page_size:
+            return
+        page += 1
+
+
 def upload(download_url, resource_type):
     """
-    check the article title is exist
+    upload the resource to the CMS, reusing an earlier upload of the same url or content
+    """
+    cache = media_cache()
+    if cache is None:
+        return _tracked_upload(download_url, resource_type)[0]
+
+    cms_url = cache.lookup_url(download_url, resource_type)
+    if cms_url:
+        metrics.MEDIA.inc(outcome='cached_url')
+        return cms_url
+
+    cms_url, content_hash = _tracked_upload(download_url, resource_type)
+    if cms_url:
+        cache.remember(download_url, resource_type, cms_url, content_hash)
+    return cms_url
+
+
+def _tracked_upload(download_url, resource_type):
+    with metrics.track('upload') as timer:
+        try:
+            cms_url, content_hash = _upload(download_url, resource_type)
+        except MediaRejected as e:
+            metrics.MEDIA.inc(outcome='skipped_probe')
+            logger.info("Media skipped", extra={'url': download_url, 'reason': str(e)})
+            return False, None
+        timer.failed = not cms_url
+    if not cms_url:
+        metrics.MEDIA.inc(outcome='failed')
+    return cms_url, content_hash
+
+
+def _upload(download_url, resource_type):
+    """
+    download the resource and upload it to the CMS
+
+    :return: (CMS 地址，失败时为 False, 下载内容的 sha256，未知时为 None)
     """
     if resource_type == 'image':
         url = CONFIG['CMS_HOST'] + CONFIG['IMAGE_UPLOAD_PATH']
@@ -67,7 +175,12 @@ def upload(download_url, resource_type):
         url = CONFIG['CMS_HOST'] + CONFIG['AUDIO_UPLOAD_PATH']
         file_name = get_url_file_name(download_url, resource_type)
     else:
-        return False
+        return False, None
+
+    # 下载前探测类型和大小，不符合策略的不下载
+    reason = media_policy.probe(download_url, resource_type)
+    if reason:
+        raise MediaRejected(reason)
 
     token = token_cache.get_token()
 
@@ -77,28 +190,161 @@ def upload(download_url, resource_type):
 
     try:
         # 以流式方式从 URL 获取文件内容
-        response = requests.get(download_url, stream=True)
+        response = http_client.get(download_url, stream=True)
         response.raise_for_status()  # 检查请求是否成功
     except Exception as e:
-        print(f"文件上传失败:{download_url}, {e}")
-        return False
+        logger.warning("文件上传失败", extra={'url': download_url, 'error': str(e)})
+        return False, None
+
+    with response:
+        # 读取正文之前按响应头再检查一次，探测关闭或服务端不支持 HEAD 时也能拦截
+        reason = media_policy.check_headers(resource_type, response.headers)
+        if reason:
+            raise MediaRejected(reason)
+
+        length = _content_length(response)
+        # 较小的文件整体读入，上传前可以按内容哈希去重
+        cache = media_cache()
+        dedupe_in_memory = (cache is not None and length is not None
+                            and length <= CONFIG.get('MEDIA_DEDUP_MAX_BYTES', 8 * 1024 * 1024))
+        # 开启图片优化时图片需要完整读入后重新编码，不走流式转发
+        optimizer = image_optimizer() if resource_type == 'image' else None
+        if CONFIG.get('MEDIA_STREAM_UPLOAD', False) and not dedupe_in_memory and optimizer is None:
+            return _relay(response, url, headers, download_url, file_name, resource_type)
+
+        with media_budget.reserve(length or 0):
+            content = _read_content(response, resource_type)
+            content_hash = hashlib.sha256(content).hexdigest()
+            if cache is not None:
+                cms_url = cache.lookup_hash(content_hash, resource_type)
+                if cms_url:
+                    metrics.MEDIA.inc(outcome='cached_hash')
+                    return cms_url, content_hash
+
+            # 去重仍按下载的原始内容计算哈希，优化只影响上传的内容
+            if optimizer is not None:
+                content, file_name = _optimize_image(optimizer, content, file_name)
+
+            # 读取内容并上传，确保用正确的文件名和 MIME 类型
+            files = {
+                'file': (file_name, content)
+            }
+            return _post_upload(url, headers, download_url, files=files), content_hash
+
+
+def _optimize_image(optimizer, content, file_name):
+    """
+    在进程池中压缩图片，记录压缩前后的字节数
+    :return: (上传的内容, 文件名)
+    """
+    with metrics.track('image_optimize', profile=False):
+        optimized, file_name = optimizer.optimize(content, file_name)
+    metrics.IMAGE_BYTES.inc(len(content), stage='original')
+    metrics.IMAGE_BYTES.inc(len(optimized), stage='uploaded')
+    return optimized, file_name
 
-    # 读取内容并上传，确保用正确的文件名和 MIME 类型
-    files = {
-        'file': (file_name, response.content)
-    }
 
+class _StreamingBody:
+    """
+    把下载中的内容包装成已知长度的只读文件对象，MultipartEncoder 按块读取，边下边传
+    """
+
+    def __init__(self, fileobj, length, chunk_size):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        # MultipartEncoder 通过 len 属性获取剩余字节数
+        self.len = length
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if self.len <= 0:
+            return b''
+        if size is None or size < 0 or size > self._chunk_size:
+            size = self._chunk_size
+
+        data = self._fileobj.read(min(size, self.len))
+        if not data:
+            raise IOError(f'源文件提前结束，还剩 {self.len} 字节')
+        self.len -= len(data)
+        self.sha256.update(data)
+        return data
+
+
+def _read_content(response, resource_type):
+    """
+    读取完整正文，超过该类型的大小上限时中止；长度未知（分块传输）时响应头检查不到大小
+    """
+    buffer = bytearray()
+    for chunk in response.iter_content(CONFIG.get('MEDIA_STREAM_CHUNK_SIZE', 64 * 1024)):
+        buffer += chunk
+        reason = media_policy.check_size(resource_type, len(buffer))
+        if reason:
+            raise MediaRejected(reason)
+    return bytes(buffer)
+
+
+def _content_length(response):
+    try:
+        return int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _relay(response, url, headers, download_url, file_name, resource_type):
+    """
+    relay the download to the CMS without holding the whole file in memory
+
+    :return: (CMS 地址，失败时为 False, 转发内容的 sha256)
+    """
+    chunk_size = CONFIG.get('MEDIA_STREAM_CHUNK_SIZE', 64 * 1024)
+
+    length = _content_length(response)
+    if length is not None and response.headers.get('Content-Encoding', 'identity') == 'identity':
+        with media_budget.reserve(length):
+            return _post_multipart(url, headers, download_url, file_name,
+                                   _StreamingBody(response.raw, length, chunk_size))
+
+    # 长度未知或经过压缩编码时先写入临时文件，超出内存阈值的部分落盘
+    spool_size = CONFIG.get('MEDIA_SPOOL_MAX_MEMORY', 8 * 1024 * 1024)
+    with media_budget.reserve(spool_size), tempfile.SpooledTemporaryFile(max_size=spool_size) as spool:
+        try:
+            for chunk in response.iter_content(chunk_size):
+                spool.write(chunk)
+                reason = media_policy.check_size(resource_type, spool.tell())
+                if reason:
+                    raise MediaRejected(reason)
+        except MediaRejected:
+            raise
+        except Exception as e:
+            logger.warning("文件上传失败", extra={'url': download_url, 'error': str(e)})
+            return False, None
+
+        length = spool.tell()
+        spool.seek(0)
+        return _post_multipart(url, headers, download_url, file_name, _StreamingBody(spool, length, chunk_size))
+
+
+def _post_multipart(url, headers, download_url, file_name, body):
+    encoder = MultipartEncoder(fields={'file': (file_name, body)})
+    headers = dict(headers, **{'Content-Type': encoder.content_type})
+    cms_url = _post_upload(url, headers, download_url, data=encoder)
+    # 只有完整转发的内容才有可信的哈希
+    return cms_url, body.sha256.hexdigest() if cms_url and body.len == 0 else None
+
+
+def _post_upload(url, headers, download_url, **kwargs):
     try:
-        response = requests.post(url, headers=headers, files=files)
+        response = http_client.post(url, headers=headers, **kwargs)
+        _check_auth(response)
         url = response.json().get('url')
         if url:
+            metrics.MEDIA.inc(outcome='uploaded')
             return url
         else:
-            print('文件上传失败: ' + download_url)
+            logger.warning("文件上传失败", extra={'url': download_url, 'status': response.status_code})
         return False
     except Exception as e:
-        print('文件上传失败: ' + download_url)
-        print(f"文件上传失败: {e}")
+        logger.warning("文件上传失败", extra={'url': download_url, 'error': str(e)})
         return False
 
 
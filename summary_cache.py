@@ -0,0 +1,123 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from local_store import SQLiteStore
+
+# 磁盘缓存每写入这么多条记录检查一次上限，避免每次写入都扫描索引
+_EVICT_EVERY = 256
+
+
+def make_key(*parts):
+    """
+    根据输入文本和参数生成缓存键
+    :param parts: 参与计算的文本、语言、参数、算法版本等，需可被 JSON 序列化
+    :return: sha256 十六进制字符串
+    """
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _DiskTier(SQLiteStore):
+    SCHEMA = (
+        '''CREATE TABLE IF NOT EXISTS summary_cache (
+               key TEXT PRIMARY KEY,
+               value TEXT NOT NULL,
+               accessed_at REAL NOT NULL
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_summary_cache_accessed ON summary_cache (accessed_at)',
+    )
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._writes = 0
+
+    def get(self, key):
+        rows = self.query('SELECT value FROM summary_cache WHERE key = ?', (key,))
+        if not rows:
+            return None
+        self.execute('UPDATE summary_cache SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return json.loads(rows[0][0])
+
+    def set(self, key, value, max_entries):
+        self.execute('INSERT OR REPLACE INTO summary_cache (key, value, accessed_at) VALUES (?, ?, ?)',
+                     (key, json.dumps(value, ensure_ascii=False), time.time()))
+        with self._lock:
+            self._writes += 1
+            due = self._writes % _EVICT_EVERY == 0
+        if max_entries and due:
+            # 超出上限时批量淘汰最久未访问的记录，两次检查之间最多超出 _EVICT_EVERY 条
+            self.execute('''DELETE FROM summary_cache WHERE key IN (
+                                SELECT key FROM summary_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                            )''', (max_entries,))
+
+
+class SummaryCache:
+    """摘要和关键词的两级缓存：内存 LRU + 可选的 SQLite 磁盘缓存"""
+
+    def __init__(self, max_entries=1024, disk_path=None, disk_max_entries=100000):
+        """
+        Args:
+            max_entries (int): 内存中最多缓存的结果数
+            disk_path (str): 磁盘缓存的数据库路径，为空时只使用内存缓存
+            disk_max_entries (int): 磁盘缓存最多保存的结果数，0 表示不限制
+        """
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _DiskTier(disk_path) if disk_path else None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        查询缓存
+        :param key: make_key 生成的键
+        :return: 缓存的结果，未命中时为 None
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        value = self._disk.get(key) if self._disk else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        写入缓存
+        :param key: make_key 生成的键
+        :param value: 可被 JSON 序列化的结果
+        """
+        self._remember(key, value)
+        if self._disk:
+            self._disk.set(key, value, self.disk_max_entries)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        """返回命中/未命中计数"""
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'memory_entries': len(self._memory),
+            }
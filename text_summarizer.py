@@ -1,21 +1,83 @@
-import jieba
-import jieba.analyse
-import networkx as nx
-import numpy as np
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+import logging
 import re
+import string
+import threading
+
+from document_frequency import DocumentFrequencyStore
+from summary_cache import make_key
+from util import LazyModule, process_pool_context
+
+# jieba、networkx、numpy 加载需要一秒以上，首次计算时才导入
+jieba = LazyModule('jieba')
+jieba_analyse = LazyModule('jieba.analyse')
+nx = LazyModule('networkx')
+np = LazyModule('numpy')
+
+logger = logging.getLogger(__name__)
+
+# 算法版本号，摘要或关键词的计算方式变化时递增，使旧的缓存结果失效
+ALGORITHM_VERSION = 3
+
+# 英文关键词把撇号、连字符以外的标点替换为空格，"market," 和 "market" 计为同一个词
+_KEYWORD_PUNCTUATION = str.maketrans({c: ' ' for c in string.punctuation + '“”‘’' if c not in "'-"})
+
+# 英文关键词的停用词：虚词、代词、助动词和常见的泛化词，这些词在任何文章中词频都高，不能作为标签
+_ENGLISH_KEYWORD_STOPWORDS = frozenset("""
+a about above after again against all also am an and any are aren't as at be because been before being below
+between both but by can can't cannot could couldn't did didn't do does doesn't doing don't down during each
+either else etc even ever every few for from further get gets got had hadn't has hasn't have haven't having he
+he'd he'll he's her here here's hers herself him himself his how how's however i i'd i'll i'm i've if in into
+is isn't it it's its itself just let's like many may me might more most much must mustn't my myself new no nor
+not now of off often on once one only or other others our ours ourselves out over own per rather said same say
+says shall shan't she she'd she'll she's should shouldn't since so some still such than that that's the their
+theirs them themselves then there there's these they they'd they'll they're they've this those though through
+thus to too under until up upon us use used using very via was wasn't we we'd we'll we're we've well were
+weren't what what's when when's where where's whether which while who who's whom whose why why's will with
+within without won't would wouldn't yet you you'd you'll you're you've your yours yourself yourselves
+""".split())
+
+
+@lru_cache(maxsize=None)
+def _sparse():
+    """scipy.sparse 模块，scipy 不是必需依赖，缺失时返回 None，退化为稠密矩阵"""
+    try:
+        from scipy import sparse
+    except ImportError:
+        return None
+    return sparse
 
 
 class TextSummarizer:
     """文本摘要生成器，基于TextRank算法实现自动文本摘要"""
 
-    def __init__(self, language='chinese'):
+    def __init__(self, language='chinese', engine='vectorized', cache=None, process_workers=None,
+                 document_frequencies=None, long_document_sentences=400, chunk_sentences=200):
         """初始化摘要生成器
         
         Args:
             language (str): 文本语言，支持'chinese'和'english'，默认为'chinese'
+            engine (str): 计算引擎，'vectorized'为矩阵化实现，'networkx'为逐对计算的原始实现
+            cache (SummaryCache): 摘要和关键词的结果缓存，为None时不缓存
+            process_workers (int): 批量接口使用的进程数，默认为CPU核数，0表示在当前进程中计算
+            document_frequencies (DocumentFrequencyStore): 语料库的文档频率，英文关键词按TF-IDF打分，
+                为None时只按词频
+            long_document_sentences (int): 句子数超过该值时按块分层计算，耗时与内存不再随句子数平方增长，
+                0表示不分块
+            chunk_sentences (int): 分层计算时每块的句子数，也是合并阶段候选句子数的上限
         """
         self.language = language
+        self.engine = engine
+        self.cache = cache
+        self.process_workers = process_workers
+        self.document_frequencies = document_frequencies
+        self.long_document_sentences = long_document_sentences
+        self.chunk_sentences = max(2, int(chunk_sentences))
+        self._pool = None
+        self._pool_lock = threading.Lock()
         # 停用词列表
         self.stopwords = {'的', '了', '和', '是', '就', '都', '而', '及', '与', '着', 'the', 'a', 'an', 'and', 'or',
                           'but', 'in', 'on', 'at', 'to'}
@@ -40,6 +102,30 @@ class TextSummarizer:
         # 过滤空句子
         return [s.strip() for s in sentences if s.strip()]
 
+    def _tokenize(self, sentence):
+        """将句子切分为去除停用词后的词列表
+        
+        Args:
+            sentence (str): 输入句子
+            
+        Returns:
+            list: 词列表
+        """
+        if self.language == 'chinese':
+            return [w for w in jieba.cut(sentence) if w not in self.stopwords]
+        return [w.lower() for w in sentence.split() if w.lower() not in self.stopwords]
+
+    def tokenize(self, text):
+        """将整段文本分句后切分为去除停用词后的词列表，与摘要计算使用相同的分词方式
+        
+        Args:
+            text (str): 输入文本
+            
+        Returns:
+            list: 词列表
+        """
+        return [word for sentence in self._split_sentences(text) for word in self._tokenize(sentence)]
+
     def _calculate_similarity(self, sentence1, sentence2):
         """计算两个句子的相似度
         
@@ -50,12 +136,8 @@ class TextSummarizer:
         Returns:
             float: 相似度分数
         """
-        if self.language == 'chinese':
-            words1 = [w for w in jieba.cut(sentence1) if w not in self.stopwords]
-            words2 = [w for w in jieba.cut(sentence2) if w not in self.stopwords]
-        else:
-            words1 = [w.lower() for w in sentence1.split() if w.lower() not in self.stopwords]
-            words2 = [w.lower() for w in sentence2.split() if w.lower() not in self.stopwords]
+        words1 = self._tokenize(sentence1)
+        words2 = self._tokenize(sentence2)
 
         # 创建词频字典
         word_freq1 = defaultdict(int)
@@ -104,6 +186,144 @@ class TextSummarizer:
 
         return similarity_matrix
 
+    def _term_count_matrix(self, sentences):
+        """每个句子只分词一次，构建句子-词频矩阵
+        
+        Args:
+            sentences (list): 句子列表
+            
+        Returns:
+            句子数×词表大小的词频矩阵，安装了scipy时为稀疏矩阵
+        """
+        vocabulary = {}
+        rows, cols, counts = [], [], []
+        for i, sentence in enumerate(sentences):
+            word_freq = defaultdict(int)
+            for word in self._tokenize(sentence):
+                word_freq[word] += 1
+            for word, freq in word_freq.items():
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+                counts.append(freq)
+
+        shape = (len(sentences), max(len(vocabulary), 1))
+        sparse = _sparse()
+        if sparse is not None:
+            return sparse.csr_matrix((counts, (rows, cols)), shape=shape, dtype=np.float64)
+
+        matrix = np.zeros(shape)
+        matrix[rows, cols] = counts
+        return matrix
+
+    def _build_similarity_matrix_vectorized(self, sentences):
+        """通过一次矩阵乘法计算所有句子对的余弦相似度，结果与_build_similarity_matrix一致
+        
+        Args:
+            sentences (list): 句子列表
+            
+        Returns:
+            numpy.ndarray: 按行归一化的相似度矩阵
+        """
+        counts = self._term_count_matrix(sentences)
+        gram = counts @ counts.T
+        sparse = _sparse()
+        if sparse is not None and sparse.issparse(gram):
+            gram = gram.toarray()
+        gram = np.asarray(gram, dtype=np.float64)
+
+        norms = np.sqrt(np.diag(gram))
+        denominator = np.outer(norms, norms)
+        similarity_matrix = np.divide(gram, denominator, out=np.zeros_like(gram), where=denominator > 0)
+        np.fill_diagonal(similarity_matrix, 0)
+
+        # 归一化处理
+        row_sums = similarity_matrix.sum(axis=1, keepdims=True)
+        np.divide(similarity_matrix, row_sums, out=similarity_matrix, where=row_sums != 0)
+
+        return similarity_matrix
+
+    @staticmethod
+    def _pagerank(similarity_matrix, damping=0.85, max_iter=100, tol=1.0e-6):
+        """用幂迭代计算PageRank，语义与networkx.pagerank作用于from_numpy_array构建的无向图相同
+        
+        Args:
+            similarity_matrix (numpy.ndarray): 相似度矩阵
+            damping (float): 阻尼系数
+            max_iter (int): 最大迭代次数
+            tol (float): 收敛阈值，按节点数放大后与两次迭代的L1差比较
+            
+        Returns:
+            numpy.ndarray: 每个句子的得分
+        """
+        n = similarity_matrix.shape[0]
+        # 无向图中边(i, j)的权重取矩阵下三角的值
+        lower = np.tril(similarity_matrix, k=-1)
+        weights = lower + lower.T
+
+        out_weight = weights.sum(axis=1)
+        dangling = out_weight == 0
+        transition = np.divide(weights, out_weight[:, None], out=np.zeros_like(weights), where=~dangling[:, None])
+
+        uniform = np.full(n, 1.0 / n)
+        scores = uniform.copy()
+        for _ in range(max_iter):
+            last = scores
+            scores = damping * (last @ transition + last[dangling].sum() * uniform) + (1 - damping) * uniform
+            if np.abs(scores - last).sum() < n * tol:
+                break
+        return scores
+
+    def _sentence_scores(self, sentences):
+        """在所有句子构成的完整图上计算TextRank得分
+        
+        Args:
+            sentences (list): 句子列表
+            
+        Returns:
+            list: 每个句子的得分，总和为1
+        """
+        if self.engine == 'networkx':
+            # 构建相似度矩阵
+            similarity_matrix = self._build_similarity_matrix(sentences)
+
+            # 使用NetworkX创建图并计算PageRank值
+            nx_graph = nx.from_numpy_array(similarity_matrix)
+            return list(nx.pagerank(nx_graph).values())
+
+        similarity_matrix = self._build_similarity_matrix_vectorized(sentences)
+        return self._pagerank(similarity_matrix).tolist()
+
+    def _long_document_scores(self, sentences):
+        """长文档分层计算TextRank得分，每次只构建不超过chunk_sentences个句子的图
+        
+        1. 按原文顺序切分为块，在每块内计算得分，乘以块内句子占比后各块的得分可以相互比较
+        2. 取全文得分最高的chunk_sentences个句子为候选，在候选构成的图上重新计算得分，
+           使最终入选的句子在全文范围内最有代表性；候选的得分排在其他句子之前
+        
+        耗时与句子数成线性关系，内存占用与chunk_sentences的平方成正比。
+        
+        Args:
+            sentences (list): 句子列表
+            
+        Returns:
+            numpy.ndarray: 每个句子的得分
+        """
+        n = len(sentences)
+        size = self.chunk_sentences
+        scores = np.empty(n)
+        for start in range(0, n, size):
+            chunk = sentences[start:start + size]
+            if len(chunk) == 1:
+                scores[start] = 1.0 / n
+                continue
+            scores[start:start + len(chunk)] = np.asarray(self._sentence_scores(chunk)) * (len(chunk) / n)
+
+        # 稳定排序，分数相同时靠前的句子优先成为候选
+        candidates = np.argsort(-scores, kind='stable')[:size]
+        merged = np.asarray(self._sentence_scores([sentences[i] for i in candidates]))
+        scores[candidates] = scores.max() + merged
+        return scores
+
     def generate_summary(self, text, ratio=0.3, top_n=None):
         """生成文本摘要
         
@@ -115,6 +335,17 @@ class TextSummarizer:
         Returns:
             str: 生成的摘要文本
         """
+        if self.cache is None:
+            return self._generate_summary(text, ratio, top_n)
+
+        key = self._cache_key('summary', text, (ratio, top_n))
+        summary = self.cache.get(key)
+        if summary is None:
+            summary = self._generate_summary(text, ratio, top_n)
+            self.cache.set(key, summary)
+        return summary
+
+    def _generate_summary(self, text, ratio, top_n):
         # 分句
         sentences = self._split_sentences(text)
         if not sentences:
@@ -124,26 +355,27 @@ class TextSummarizer:
         if len(sentences) <= 3:
             return text
 
-        # 构建相似度矩阵
-        similarity_matrix = self._build_similarity_matrix(sentences)
-
-        # 使用NetworkX创建图并计算PageRank值
-        nx_graph = nx.from_numpy_array(similarity_matrix)
-        scores = nx.pagerank(nx_graph)
-
-        # 根据分数对句子排序
-        ranked_sentences = [(score, sentence) for sentence, score in zip(sentences, scores.values())]
-        ranked_sentences.sort(reverse=True)
-
         # 确定要选择的句子数量
         if top_n is not None:
-            n_sentences = min(top_n, len(ranked_sentences))
+            n_sentences = min(top_n, len(sentences))
         else:
             n_sentences = max(3, int(len(sentences) * ratio))
 
-        # 按原文顺序重新排列选中的句子
+        if self.long_document_sentences and len(sentences) > self.long_document_sentences:
+            scores = self._long_document_scores(sentences).tolist()
+        else:
+            scores = self._sentence_scores(sentences)
+
+        # 根据分数对句子排序
+        ranked_sentences = [(score, sentence) for sentence, score in zip(sentences, scores)]
+        ranked_sentences.sort(reverse=True)
+
+        # 按原文顺序重新排列选中的句子，重复的句子按首次出现的位置
+        positions = {}
+        for i, sentence in enumerate(sentences):
+            positions.setdefault(sentence, i)
         selected_sentences = ranked_sentences[:n_sentences]
-        selected_sentences.sort(key=lambda x: sentences.index(x[1]))
+        selected_sentences.sort(key=lambda x: positions[x[1]])
 
         # 生成摘要文本
         if self.language == 'chinese':
@@ -163,19 +395,182 @@ class TextSummarizer:
         Returns:
             list: 关键词列表
         """
-        if self.language == 'chinese':
-            # 使用jieba的TextRank算法提取关键词
-            keywords = jieba.analyse.textrank(text, topK=top_k)
+        if self.cache is None:
+            return self._get_keywords(text, top_k)
+
+        key = self._cache_key('keywords', text, (top_k,))
+        keywords = self.cache.get(key)
+        if keywords is None:
+            keywords = self._get_keywords(text, top_k)
+            self.cache.set(key, keywords)
+        return keywords
+
+    def add_document(self, text):
+        """将文章计入语料库的文档频率统计，没有配置统计时不做任何事
+        
+        Args:
+            text (str): 文章正文
+            
+        Returns:
+            bool: 是否新计入
+        """
+        if self.document_frequencies is None:
+            return False
+        return self.document_frequencies.add_document(self._keyword_terms(text), text)
+
+    def _cache_key(self, kind, text, params):
+        if kind == 'keywords' and self.document_frequencies is not None:
+            # 按语料库打分的关键词与只按词频的结果分开缓存
+            params = tuple(params) + ('corpus',)
+        elif kind == 'summary':
+            # 长文档按块分层计算，分块参数不同时结果不同
+            params = tuple(params) + (self.long_document_sentences, self.chunk_sentences)
+        return make_key(kind, text, self.language, *params, ALGORITHM_VERSION)
+
+    def generate_summaries(self, texts, ratio=0.3, top_n=None, chunksize=4):
+        """批量生成摘要，在常驻的进程池中并行计算
+        
+        Args:
+            texts (list): 输入文本列表
+            ratio (float): 摘要占原文的比例，默认0.3
+            top_n (int): 返回前n个重要句子，如果设置了这个参数，会忽略ratio
+            chunksize (int): 每次分发给一个工作进程的文本数
+            
+        Returns:
+            list: 与texts顺序一致的摘要，处理失败的项为None
+        """
+        return self._run_batch('summary', texts, (ratio, top_n), chunksize)
+
+    def get_keywords_batch(self, texts, top_k=10, chunksize=4):
+        """批量提取关键词，在常驻的进程池中并行计算
+        
+        Args:
+            texts (list): 输入文本列表
+            top_k (int): 每个文本返回前k个关键词，默认10个
+            chunksize (int): 每次分发给一个工作进程的文本数
+            
+        Returns:
+            list: 与texts顺序一致的关键词列表，处理失败的项为None
+        """
+        return self._run_batch('keywords', texts, (top_k,), chunksize)
+
+    def _run_batch(self, kind, texts, params, chunksize):
+        results = [None] * len(texts)
+
+        # 先查缓存，只把未命中的文本交给进程池
+        pending = []
+        for i, text in enumerate(texts):
+            if self.cache is not None:
+                cached = self.cache.get(self._cache_key(kind, text, params))
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            pending.append(i)
+
+        if not pending:
+            return results
+
+        tasks = [(kind, texts[i], params) for i in pending]
+        if self.process_workers == 0:
+            outcomes = (_run_task(self, task) for task in tasks)
         else:
-            # 英文文本使用TF-IDF提取关键词
-            words = [w.lower() for w in text.split() if w.lower() not in self.stopwords]
-            word_freq = defaultdict(int)
-            for word in words:
-                word_freq[word] += 1
-            keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:top_k]
-            keywords = [word for word, _ in keywords]
+            outcomes = self._get_pool().map(_run_in_worker, tasks, chunksize=max(1, chunksize))
+
+        try:
+            for i, (ok, value) in zip(pending, outcomes):
+                if not ok:
+                    logger.warning("Error processing text", extra={'index': i, 'error': value})
+                    continue
+                results[i] = value
+                if self.cache is not None:
+                    self.cache.set(self._cache_key(kind, texts[i], params), value)
+        except BrokenProcessPool as e:
+            # 工作进程异常退出，剩余的项保持为None，下次调用时重建进程池
+            logger.error("Summarizer process pool broken", extra={'error': str(e)})
+            self.close()
+
+        return results
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=process_pool_context(),
+                    initializer=_init_worker,
+                    initargs=(self.language, self.engine, self.stopwords,
+                              self.document_frequencies.path if self.document_frequencies is not None else None,
+                              self.long_document_sentences, self.chunk_sentences)
+                )
+            return self._pool
+
+    def close(self):
+        """关闭批量接口使用的进程池"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _keyword_terms(self, text):
+        if self.language == 'chinese':
+            return self.tokenize(text)
+        terms = (word.strip("'-") for word in text.lower().translate(_KEYWORD_PUNCTUATION).split())
+        return [term for term in terms if len(term) > 1 and term not in self.stopwords
+                and term not in _ENGLISH_KEYWORD_STOPWORDS and not term.isdigit()]
 
-        return keywords
+    def _get_keywords(self, text, top_k):
+        if self.language == 'chinese':
+            # 使用jieba的TextRank算法提取关键词
+            return jieba_analyse.textrank(text, topK=top_k)
+
+        # 英文文本使用TF-IDF提取关键词，没有语料库统计时idf均为1，即按词频排序
+        counts = Counter(self._keyword_terms(text))
+        if not counts:
+            return []
+        terms = list(counts)
+        scores = np.fromiter(counts.values(), dtype=np.float64, count=len(terms))
+        if self.document_frequencies is not None:
+            scores *= self.document_frequencies.idf(terms)
+
+        # 先用argpartition取出前k个再排序，只对k个元素排序；分数相同时按首次出现的顺序
+        order = np.arange(len(terms))
+        if top_k < len(terms):
+            order = np.argpartition(-scores, top_k - 1)[:top_k]
+        order = sorted(order, key=lambda i: (-scores[i], i))
+        return [terms[i] for i in order]
+
+
+# 工作进程中的摘要生成器，每个进程只初始化一次
+_worker_summarizer = None
+
+
+def _init_worker(language, engine, stopwords, document_frequency_path=None, long_document_sentences=400,
+                 chunk_sentences=200):
+    """进程池初始化：中文时加载jieba词典，打开文档频率统计，并创建摘要生成器"""
+    global _worker_summarizer
+    if language == 'chinese':
+        jieba.initialize()
+    document_frequencies = DocumentFrequencyStore(document_frequency_path) if document_frequency_path else None
+    _worker_summarizer = TextSummarizer(language=language, engine=engine, process_workers=0,
+                                        document_frequencies=document_frequencies,
+                                        long_document_sentences=long_document_sentences,
+                                        chunk_sentences=chunk_sentences)
+    _worker_summarizer.stopwords = stopwords
+
+
+def _run_task(summarizer, task):
+    """处理一项任务，返回(是否成功, 结果或错误信息)，异常只影响该项"""
+    kind, text, params = task
+    try:
+        if kind == 'summary':
+            return True, summarizer._generate_summary(text, *params)
+        return True, summarizer._get_keywords(text, *params)
+    except Exception as e:
+        return False, f'{type(e).__name__}: {e}'
+
+
+def _run_in_worker(task):
+    return _run_task(_worker_summarizer, task)
 
 
 def main():
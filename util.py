@@ -1,4 +1,12 @@
+import importlib
+import logging
+import multiprocessing
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
 
 
 def struct_time_to_formatted_string(struct_time_obj, time_format='%Y-%m-%dT%H:%M:%S.%fZ'):
@@ -17,5 +25,124 @@ def struct_time_to_formatted_string(struct_time_obj, time_format='%Y-%m-%dT%H:%M
 
         return formatted_str
     except Exception as e:
-        print(f"Error struct_time_to_formatted_string: {e}, use current time")
+        logger.warning("Error struct_time_to_formatted_string, use current time", extra={'error': str(e)})
         return datetime.now().strftime(time_format)
+
+
+class HostLimiter:
+    """按主机限制并发请求数，避免同一站点被过多并发请求拖慢或封禁"""
+
+    def __init__(self, per_host_limit):
+        """
+        :param per_host_limit: 每个主机允许同时进行的请求数
+        """
+        self.per_host_limit = max(1, int(per_host_limit))
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._semaphores[host] = semaphore
+            return semaphore
+
+    @contextmanager
+    def slot(self, url):
+        """
+        占用 url 所属主机的一个请求名额，退出上下文时释放
+        :param url: 请求地址
+        """
+        semaphore = self._semaphore(urlparse(url).netloc.lower())
+        with semaphore:
+            yield
+
+
+class ByteBudget:
+    """全局字节预算，限制同时处于传输中的数据总量"""
+
+    def __init__(self, capacity):
+        """
+        :param capacity: 允许同时占用的字节数，小于等于 0 表示不限制
+        """
+        self.capacity = int(capacity)
+        self.in_use = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, size):
+        """
+        占用 size 字节的预算，预算不足时等待，退出上下文时归还。
+        超过总预算的单次请求会等到预算完全空闲后独占执行。
+        :param size: 需要占用的字节数
+        """
+        if self.capacity <= 0:
+            yield
+            return
+
+        size = min(max(0, int(size)), self.capacity)
+        with self._condition:
+            while self.in_use and self.in_use + size > self.capacity:
+                self._condition.wait()
+            self.in_use += size
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= size
+                self._condition.notify_all()
+
+
+class LazyModule:
+    """首次访问属性时才导入模块，推迟加载 jieba、numpy 等较重的依赖"""
+
+    def __init__(self, name):
+        """
+        :param name: 模块名，如 'numpy'、'jieba.analyse'
+        """
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+
+class Lazy:
+    """线程安全的延迟初始化：首次调用时通过 factory 创建对象，之后一直返回同一个对象"""
+
+    _UNSET = object()
+
+    def __init__(self, factory):
+        """
+        :param factory: 无参数的可调用对象，返回值可以为 None（如功能未配置）
+        """
+        self._factory = factory
+        self._value = self._UNSET
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        value = self._value
+        if value is self._UNSET:
+            with self._lock:
+                if self._value is self._UNSET:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    def initialized(self):
+        """是否已经创建，用于退出时只清理已创建的对象"""
+        return self._value is not self._UNSET
+
+
+def process_pool_context():
+    """
+    进程池使用的 multiprocessing 上下文。进程池在采集进程中按需创建，此时已有多个线程、
+    打开的 SQLite 连接和被其他线程持有的锁，fork 出的子进程可能因继承这些锁而死锁，
+    因此优先使用 forkserver，不支持时（Windows）使用 spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')